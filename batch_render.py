@@ -0,0 +1,285 @@
+"""Render maps from a manifest of jobs without the Streamlit UI.
+
+Usage:
+    python batch_render.py manifest.json [--workers N] [--output-dir DIR]
+
+The manifest is a JSON object with a list of jobs and optional defaults
+merged into every job:
+
+    {
+      "output_dir": "maps",
+      "defaults": {"color_scheme": "Blues", "formats": ["html", "png"]},
+      "jobs": [
+        {"name": "population", "data": "sample:World Population", "map_type": "choropleth",
+         "region_type": "world", "join_column": "country_code", "value_column": "population_millions"},
+        {"name": "sensors", "data": "data/sensors.csv", "map_type": "aggregated_points",
+         "lat_column": "lat", "lon_column": "lon", "value_column": "pm25",
+         "grid": "hexagon", "cell_size": 0.5, "aggregation": "mean"}
+      ]
+    }
+
+`data` is a file path or "sample:<dataset name>". Map types are choropleth
+(optionally aggregating points into regions when lat_column, lon_column and
+aggregation are given, or animated over a period_column), point and
+aggregated_points. Choropleth and point maps color their values by a
+`classification` scheme: quantile (the default, as in the app),
+equal_interval, std_dev or natural_breaks, split into as many classes as
+the app uses. Choropleth jobs over CSV or Parquet files larger than
+memory can set "out_of_core": true; the file is then streamed, aggregated
+by join_column with the job's aggregation on all cores, and only one row
+per region is kept. Boundaries are loaded once in the parent before the
+worker pool starts; forked workers inherit them and other platforms reopen
+the memory-mapped boundary packs. A JSON report with per-job timings is
+written next to the outputs.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from streamlit.logger import set_log_level
+
+from boundary_store import region_code_column
+from classify import CLASSIFICATION_SCHEMES, DEFAULT_CLASSES, DEFAULT_SCHEME
+from data_sources import (load_breaks, load_geo_data, load_point_bins, load_region_aggregates, load_region_matches,
+                          load_sample_data, load_simplified_geo_data, process_uploaded_data)
+from geometry_lod import pick_lod_tolerance
+from map_builders import (MAP_ZOOM_START, apply_region_matches, create_binned_map, create_choropleth_map,
+                          create_point_map, create_time_series_map, resolve_geo_join_column)
+from map_export import draw_static_map
+from rollup import ROLLUP_EXTENSIONS, rollup_file
+
+MAP_TYPES = ("choropleth", "point", "aggregated_points")
+BATCH_FORMATS = ("html", "png", "svg")
+REPORT_FILE = "batch_report.json"
+
+JOB_DEFAULTS = {
+    "color_scheme": "Blues",
+    "formats": ["html", "png"],
+    "grid": "square",
+    "cell_size": 1.0,
+    "aggregation": "count",
+    "classification": DEFAULT_SCHEME,
+}
+
+
+# Function to read a manifest and resolve every job against the defaults
+def load_manifest(path):
+    with open(path) as f:
+        manifest = json.load(f)
+    # Relative paths in the manifest are relative to the manifest itself
+    base_dir = os.path.dirname(os.path.abspath(path))
+    defaults = {**JOB_DEFAULTS, **manifest.get("defaults", {})}
+
+    jobs = []
+    for i, job in enumerate(manifest.get("jobs", [])):
+        job = {**defaults, **job}
+        if job.get("map_type") not in MAP_TYPES:
+            raise ValueError(f"Job {i}: map_type must be one of {', '.join(MAP_TYPES)}")
+        if "data" not in job or "value_column" not in job:
+            raise ValueError(f"Job {i}: 'data' and 'value_column' are required")
+        if job["classification"] not in CLASSIFICATION_SCHEMES:
+            raise ValueError(f"Job {i}: classification must be one of {', '.join(CLASSIFICATION_SCHEMES)}")
+        unknown = set(job["formats"]) - set(BATCH_FORMATS)
+        if unknown:
+            raise ValueError(f"Job {i}: unknown formats {sorted(unknown)}")
+        if job.get("out_of_core"):
+            if job["map_type"] != "choropleth" or "join_column" not in job or "region_type" not in job:
+                raise ValueError(f"Job {i}: out_of_core needs a choropleth job with join_column and region_type")
+            if "lat_column" in job or "period_column" in job:
+                raise ValueError(f"Job {i}: out_of_core aggregates by join_column; drop lat_column and period_column")
+            if os.path.splitext(job["data"])[1].lower() not in ROLLUP_EXTENSIONS:
+                raise ValueError(f"Job {i}: out_of_core needs a CSV or Parquet file")
+        if not job["data"].startswith("sample:"):
+            job["data"] = os.path.join(base_dir, job["data"])
+        job.setdefault("name", f"job{i:03d}-{job['map_type']}")
+        job["name"] = re.sub(r"[^A-Za-z0-9_.-]", "_", job["name"])
+        jobs.append(job)
+    return os.path.join(base_dir, manifest.get("output_dir", "maps")), jobs
+
+
+# Function to load a job's data once per process
+@lru_cache(maxsize=8)
+def load_job_data(source):
+    if source.startswith("sample:"):
+        return load_sample_data(source[len("sample:"):])
+    # Errors propagate to run_job, which records them in the job's report entry
+    with open(source, "rb") as f:
+        return process_uploaded_data(f, raise_errors=True)
+
+
+# Function to aggregate a job's file by its join column without loading it, once per process
+@lru_cache(maxsize=8)
+def load_job_rollup(source, join_column, value_column, aggregation):
+    data, _, _ = rollup_file(source, os.path.splitext(source)[1].lower(), join_column, value_column, how=aggregation)
+    return data
+
+
+# Function to identify the data a job maps, for the caches keyed by data fingerprint
+def job_fingerprint(job):
+    if job.get("out_of_core"):
+        return f"{job['data']}:{job['join_column']}:{job['value_column']}:{job['aggregation']}"
+    return job["data"]
+
+
+# Function to return the boundary tolerance a job's choropleth is drawn at
+def job_tolerance(job):
+    return job.get("tolerance", pick_lod_tolerance(zoom=MAP_ZOOM_START))
+
+
+# Function to build the folium map a job describes
+def build_job_map(job, data):
+    if job["map_type"] == "point":
+        breaks = load_breaks(data, job["data"], job["value_column"], job["classification"], DEFAULT_CLASSES)
+        return create_point_map(data, job["lat_column"], job["lon_column"], job["value_column"], job["color_scheme"],
+                                breaks=breaks)
+
+    if job["map_type"] == "aggregated_points":
+        grid = job["grid"]
+        bins = load_point_bins(data, job_fingerprint(job), job["lat_column"], job["lon_column"],
+                               job["value_column"], "square" if grid == "heatmap" else grid, job["cell_size"])
+        return create_binned_map(bins, job["value_column"], grid, job["cell_size"], job["aggregation"],
+                                 job["color_scheme"])
+
+    region_type = job.get("region_type")
+    if region_type is None:
+        # An uploaded boundary file carries its own geometry
+        breaks = load_breaks(data, job["data"], job["value_column"], job["classification"], DEFAULT_CLASSES)
+        return create_choropleth_map(data, data, job["join_column"], job["value_column"], job["color_scheme"],
+                                     breaks)
+
+    geo_data = load_simplified_geo_data(region_type, job_tolerance(job))
+    if geo_data is None:
+        raise ValueError(f"No boundaries for region type {region_type}")
+    join_column = job.get("join_column")
+    fingerprint = job_fingerprint(job)
+    if "period_column" not in job and "lat_column" in job and "lon_column" in job:
+        data, _ = load_region_aggregates(data, job["data"], job["lat_column"], job["lon_column"],
+                                         job["value_column"], region_type, job["aggregation"])
+        join_column = region_code_column(region_type)
+        fingerprint = f"{fingerprint}:{region_type}:{job['aggregation']}"
+    else:
+        # Names, ISO-2/ISO-3 and numeric codes are all matched onto the boundaries' keys
+        key_column = resolve_geo_join_column(geo_data, join_column)
+        data = apply_region_matches(data, join_column, load_region_matches(
+            data, fingerprint, join_column, region_type, key_column))
+    breaks = load_breaks(data, fingerprint, job["value_column"], job["classification"], DEFAULT_CLASSES)
+    if "period_column" in job:
+        return create_time_series_map(data, geo_data, join_column, job["period_column"], job["value_column"],
+                                      job["color_scheme"], breaks)
+    return create_choropleth_map(data, geo_data, join_column, job["value_column"], job["color_scheme"], breaks)
+
+
+# Function to run one job and report its outputs and timings
+def run_job(job, output_dir):
+    timings = {}
+    outputs = {}
+    start = time.perf_counter()
+    try:
+        step = time.perf_counter()
+        if job.get("out_of_core"):
+            data = load_job_rollup(job["data"], job["join_column"], job["value_column"], job["aggregation"])
+        else:
+            data = load_job_data(job["data"])
+        if data is None:
+            raise ValueError(f"Could not load data from {job['data']}")
+        timings["load_s"] = time.perf_counter() - step
+
+        step = time.perf_counter()
+        m = build_job_map(job, data)
+        timings["build_s"] = time.perf_counter() - step
+
+        for file_format in job["formats"]:
+            step = time.perf_counter()
+            path = os.path.join(output_dir, f"{job['name']}.{file_format}")
+            if file_format == "html":
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(m.get_root().render())
+            else:
+                with open(path, "wb") as f:
+                    f.write(draw_static_map(m, file_format))
+            timings[f"{file_format}_s"] = time.perf_counter() - step
+            outputs[file_format] = {"path": path, "bytes": os.path.getsize(path)}
+        status, error = "ok", None
+    except Exception as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"
+
+    timings["total_s"] = time.perf_counter() - start
+    return {"name": job["name"], "status": status, "error": error, "pid": os.getpid(),
+            "timings": {name: round(value, 4) for name, value in timings.items()}, "outputs": outputs}
+
+
+# Function to load every boundary set and level the jobs need
+def prepare_boundaries(jobs):
+    for region_type, tolerance in sorted({(job["region_type"], job_tolerance(job)) for job in jobs
+                                          if job["map_type"] == "choropleth" and job.get("region_type")}):
+        # Loading builds any missing boundary pack, so workers only ever open it;
+        # a region that cannot be loaded only fails the jobs that use it
+        try:
+            load_geo_data(region_type)
+            load_simplified_geo_data(region_type, tolerance)
+        except Exception as e:
+            print(f"{region_type}: boundaries could not be loaded ({e})", file=sys.stderr)
+
+
+def _init_worker(jobs):
+    set_log_level("error")
+    prepare_boundaries(jobs)
+
+
+# Function to run all jobs across a process pool, in manifest order
+def run_batch(jobs, output_dir, workers=None):
+    os.makedirs(output_dir, exist_ok=True)
+    prepare_boundaries(jobs)
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(jobs) <= 1:
+        return [run_job(job, output_dir) for job in jobs]
+
+    # Forked workers share the boundaries already loaded here copy-on-write
+    context = multiprocessing.get_context("fork") if sys.platform.startswith("linux") else None
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=context,
+                             initializer=_init_worker, initargs=(jobs,)) as pool:
+        return list(pool.map(run_job, jobs, [output_dir] * len(jobs)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("manifest")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--output-dir", default=None, help="overrides the manifest's output_dir")
+    args = parser.parse_args(argv)
+    set_log_level("error")
+
+    output_dir, jobs = load_manifest(args.manifest)
+    output_dir = args.output_dir or output_dir
+
+    start = time.perf_counter()
+    results = run_batch(jobs, output_dir, args.workers)
+    elapsed = time.perf_counter() - start
+
+    print(f"{'job':<30} {'status':<7} {'load_s':>7} {'build_s':>8} {'total_s':>8}")
+    for result in results:
+        t = result["timings"]
+        print(f"{result['name']:<30} {result['status']:<7} {t.get('load_s', 0):>7.2f} "
+              f"{t.get('build_s', 0):>8.2f} {t['total_s']:>8.2f}")
+        if result["error"]:
+            print(f"    {result['error']}")
+
+    failed = sum(result["status"] != "ok" for result in results)
+    report = {"manifest": os.path.abspath(args.manifest), "workers": args.workers or os.cpu_count(),
+              "jobs": len(results), "failed": failed, "elapsed_s": round(elapsed, 4), "results": results}
+    with open(os.path.join(output_dir, REPORT_FILE), "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"{len(results) - failed}/{len(results)} jobs in {elapsed:.2f}s; report: "
+          f"{os.path.join(output_dir, REPORT_FILE)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
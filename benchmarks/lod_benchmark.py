@@ -0,0 +1,57 @@
+"""Report choropleth payload size and render time for each level of detail.
+
+Usage:
+    python benchmarks/lod_benchmark.py [path/to/boundaries.shp] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import time
+
+import folium
+import geopandas as gpd
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from geometry_lod import LOD_TOLERANCES, simplify_boundaries  # noqa: E402
+
+DEFAULT_BOUNDARIES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, "ne_110m_admin_0_countries.shp"
+)
+
+
+# Function to build and render a map for one boundary level, returning the HTML
+def render_level(geo_data):
+    m = folium.Map(location=[20, 0], zoom_start=2, tiles=None)
+    folium.GeoJson(geo_data.__geo_interface__, name="boundaries").add_to(m)
+    return m.get_root().render()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("boundaries", nargs="?", default=DEFAULT_BOUNDARIES)
+    parser.add_argument("--repeat", type=int, default=3, help="renders per level; the best is reported")
+    args = parser.parse_args(argv)
+
+    geo_data = gpd.read_file(args.boundaries)
+    print(f"{'tolerance':>10} {'vertices':>10} {'simplify_s':>11} {'render_s':>9} {'payload_bytes':>14}")
+
+    for tolerance in LOD_TOLERANCES:
+        start = time.perf_counter()
+        level = simplify_boundaries(geo_data, tolerance)
+        simplify_time = time.perf_counter() - start
+
+        render_time = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            html = render_level(level)
+            render_time = min(render_time, time.perf_counter() - start)
+
+        vertices = int(shapely.get_num_coordinates(level.geometry.to_numpy()).sum())
+        payload = len(html.encode("utf-8"))
+        print(f"{tolerance:>10} {vertices:>10} {simplify_time:>11.3f} {render_time:>9.3f} {payload:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""Benchmark the load, join, render and export pipeline on synthetic data.
+
+Usage:
+    python benchmarks/pipeline_benchmark.py [--sizes 1000 10000 ...] [--output results.json]
+                                            [--baseline baseline.json] [--threshold 0.2]
+
+Synthetic point datasets (1k to 10M rows by default) and synthetic boundary
+sets of increasing complexity are generated once into a work directory. Every
+case then runs in its own child process, so the reported peak RSS belongs to
+that case alone. Results are written as JSON. With --baseline, cases whose
+wall time or peak RSS grew by more than the threshold are reported as
+regressions and the exit status is 1. A case whose process crashes, is
+killed (for example by the OOM killer) or outlives --timeout is recorded
+with an error instead of stopping the run.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import resource
+import signal
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+# Synthetic boundary sets as (regions, vertices per region)
+DEFAULT_BOUNDARIES = [(100, 32), (1_000, 128), (5_000, 512)]
+# Point maps above this size are skipped; their HTML alone runs to gigabytes
+MAX_POINT_MAP_ROWS = 1_000_000
+
+DEFAULT_WORK_DIR = os.path.join(tempfile.gettempdir(), "geodata-bench")
+
+# Longest a single case may run before its process is killed and the case recorded as failed
+DEFAULT_CASE_TIMEOUT_S = 3600
+
+# Regressions smaller than this are timer noise
+MIN_REGRESSION_SECONDS = 0.05
+MIN_REGRESSION_MB = 10
+
+
+# Function to return this process's peak resident set size in MB
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# Function to name a synthetic boundary set
+def boundary_region_type(regions, vertices):
+    return f"synthetic-{regions}x{vertices}"
+
+
+# Function to generate wobbly polygons on a global grid, one per region
+def synthetic_boundaries(regions, vertices, seed=0):
+    import geopandas as gpd
+    import shapely
+
+    rng = np.random.default_rng(seed)
+    cols = int(np.ceil(np.sqrt(regions * 2)))
+    rows = int(np.ceil(regions / cols))
+    cell_w, cell_h = 360.0 / cols, 160.0 / rows
+    index = np.arange(regions)
+    cx = -180.0 + (index % cols + 0.5) * cell_w
+    cy = -80.0 + (index // cols + 0.5) * cell_h
+
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    radius = 0.45 * (1 + 0.15 * rng.standard_normal((regions, vertices)).clip(-2, 2))
+    x = cx[:, None] + radius * cell_w * np.cos(angles)[None, :]
+    y = cy[:, None] + radius * cell_h * np.sin(angles)[None, :]
+    rings = np.stack([x, y], axis=-1)
+    rings = np.concatenate([rings, rings[:, :1]], axis=1)
+
+    codes = np.char.add("R", np.char.zfill(index.astype(str), 6))
+    return gpd.GeoDataFrame({"code": codes}, geometry=shapely.polygons(rings), crs="EPSG:4326")
+
+
+# Function to generate a synthetic point dataset as CSV
+def synthetic_points_csv(path, rows, regions, seed=0):
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        "lat": rng.uniform(-80, 80, rows).round(5),
+        "lon": rng.uniform(-180, 180, rows).round(5),
+        "value": rng.gamma(2.0, 10.0, rows).round(3),
+        "region": np.char.add("R", np.char.zfill(rng.integers(0, regions, rows).astype(str), 6)),
+    })
+    frame.to_csv(path, index=False)
+
+
+# Function to generate every dataset and boundary pack the cases need, reusing earlier ones
+def prepare_work_dir(work_dir, sizes, boundaries):
+    from boundary_store import build_boundary_pack, open_boundary_pack
+
+    os.makedirs(work_dir, exist_ok=True)
+    pack_dir = os.path.join(work_dir, "packs")
+    for regions, vertices in boundaries:
+        region_type = boundary_region_type(regions, vertices)
+        if open_boundary_pack(region_type, pack_dir) is None:
+            print(f"generating boundaries {region_type}", file=sys.stderr)
+            build_boundary_pack(synthetic_boundaries(regions, vertices), region_type,
+                                codes={"region_code": ["code"]}, attributes=["code"], pack_dir=pack_dir)
+    for rows in sizes:
+        path = os.path.join(work_dir, f"points-{rows}.csv")
+        if not os.path.exists(path):
+            print(f"generating {rows:,} points", file=sys.stderr)
+            synthetic_points_csv(path, rows, max(regions for regions, _ in boundaries))
+
+
+class _UploadedFile(io.BytesIO):
+    """In-memory file with the name and size attributes Streamlit uploads have."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            super().__init__(f.read())
+        self.name = os.path.basename(path)
+        self.size = len(self.getbuffer())
+
+
+# Benchmark cases: each does its setup and returns a callable to time, which returns payload bytes
+
+def case_load_geo_data(work_dir, regions, vertices):
+    import shapely
+
+    from data_sources import load_geo_data
+
+    def run():
+        geo_data = load_geo_data(boundary_region_type(regions, vertices))
+        # Attributes plus 16 bytes per coordinate, which memory_usage does not see
+        wkb_bytes = int(shapely.get_num_coordinates(geo_data.geometry.to_numpy()).sum()) * 16
+        return int(geo_data.drop(columns=geo_data.geometry.name).memory_usage(deep=True).sum()) + wkb_bytes
+    return run
+
+
+def case_process_uploaded_data(work_dir, rows, streaming):
+    from data_sources import process_uploaded_data
+
+    uploaded_file = _UploadedFile(os.path.join(work_dir, f"points-{rows}.csv"))
+
+    def run():
+        data = process_uploaded_data(uploaded_file, streaming=streaming)
+        return int(data.memory_usage(deep=True).sum())
+    return run
+
+
+def _choropleth_inputs(regions, vertices):
+    import pandas as pd
+
+    from data_sources import load_geo_data
+
+    geo_data = load_geo_data(boundary_region_type(regions, vertices))
+    data = pd.DataFrame({"region_code": geo_data["region_code"],
+                         "value": np.random.default_rng(0).gamma(2.0, 10.0, len(geo_data))})
+    return geo_data, data
+
+
+def case_create_choropleth_map(work_dir, regions, vertices):
+    from map_builders import create_choropleth_map
+
+    geo_data, data = _choropleth_inputs(regions, vertices)
+
+    def run():
+        m = create_choropleth_map(data, geo_data, "region_code", "value")
+        return len(m.get_root().render().encode("utf-8"))
+    return run
+
+
+def case_create_point_map(work_dir, rows):
+    import pandas as pd
+
+    from map_builders import create_point_map
+
+    data = pd.read_csv(os.path.join(work_dir, f"points-{rows}.csv"))
+
+    def run():
+        m = create_point_map(data, "lat", "lon", "value")
+        return len(m.get_root().render().encode("utf-8"))
+    return run
+
+
+def case_export(work_dir, regions, vertices, file_format):
+    from map_builders import create_choropleth_map
+    from map_export import export_map
+    from render_cache import render_map
+
+    geo_data, data = _choropleth_inputs(regions, vertices)
+    rendered = render_map(f"bench-{regions}x{vertices}", create_choropleth_map(data, geo_data, "region_code", "value"))
+    cache_dir = tempfile.mkdtemp(dir=work_dir)
+
+    def run():
+        # A fresh cache directory, so the export is built rather than read back
+        try:
+            return os.path.getsize(export_map(rendered, file_format, cache_dir=cache_dir))
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    return run
+
+
+CASES = {
+    "load_geo_data": case_load_geo_data,
+    "process_uploaded_data": case_process_uploaded_data,
+    "create_choropleth_map": case_create_choropleth_map,
+    "create_point_map": case_create_point_map,
+    "export_map": case_export,
+}
+
+
+# Function to list every (case, params) pair for the requested sizes and boundary sets
+def plan_cases(sizes, boundaries):
+    plan = []
+    for regions, vertices in boundaries:
+        plan.append(("load_geo_data", {"regions": regions, "vertices": vertices}))
+        plan.append(("create_choropleth_map", {"regions": regions, "vertices": vertices}))
+        for file_format in ("html", "png"):
+            plan.append(("export_map", {"regions": regions, "vertices": vertices, "file_format": file_format}))
+    for rows in sizes:
+        for streaming in (False, True):
+            plan.append(("process_uploaded_data", {"rows": rows, "streaming": streaming}))
+        if rows <= MAX_POINT_MAP_ROWS:
+            plan.append(("create_point_map", {"rows": rows}))
+    return plan
+
+
+def _run_in_child(case, params, work_dir, results):
+    try:
+        from streamlit.logger import set_log_level
+        set_log_level("error")
+        run = CASES[case](work_dir, **params)
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        payload = run()
+        wall = time.perf_counter() - start
+        results.put({"wall_s": round(wall, 4), "peak_rss_mb": round(peak_rss_mb(), 1),
+                   "setup_rss_mb": round(rss_before, 1), "payload_bytes": payload})
+    except Exception as e:
+        results.put({"error": f"{type(e).__name__}: {e}"})
+
+
+# Function to wait for a child process's result, recording a crash or a timeout instead of hanging
+def wait_for_child(process, results, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            result = results.get(timeout=1.0)
+            break
+        except queue.Empty:
+            pass
+        if not process.is_alive():
+            # Killed before it could report, e.g. by the OOM killer
+            try:
+                result = results.get(timeout=1.0)
+            except queue.Empty:
+                code = process.exitcode
+                how = f"signal {signal.Signals(-code).name}" if code < 0 else f"exit code {code}"
+                result = {"error": f"child process died with {how} before reporting"}
+            break
+        if time.monotonic() > deadline:
+            process.kill()
+            result = {"error": f"timed out after {timeout}s"}
+            break
+    process.join()
+    return result
+
+
+# Function to run one case in a fresh process and collect its measurements
+def run_case(case, params, work_dir, timeout=DEFAULT_CASE_TIMEOUT_S):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_in_child, args=(case, params, work_dir, results))
+    process.start()
+    return {"case": case, "params": params, **wait_for_child(process, results, timeout)}
+
+
+def _case_id(result):
+    return json.dumps([result["case"], result["params"]], sort_keys=True)
+
+
+# Function to compare results with a baseline and list the regressions
+def find_regressions(results, baseline, threshold):
+    previous = {_case_id(result): result for result in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        before = previous.get(_case_id(result))
+        if before is None or "error" in result or "error" in before:
+            continue
+        for metric, floor in (("wall_s", MIN_REGRESSION_SECONDS), ("peak_rss_mb", MIN_REGRESSION_MB)):
+            old, new = before[metric], result[metric]
+            if new > old * (1 + threshold) and new - old > floor:
+                regressions.append({"case": result["case"], "params": result["params"], "metric": metric,
+                                    "baseline": old, "current": new, "ratio": round(new / old, 3) if old else None})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="point dataset row counts")
+    parser.add_argument("--boundaries", nargs="+", default=[f"{r}x{v}" for r, v in DEFAULT_BOUNDARIES],
+                        help="synthetic boundary sets as REGIONSxVERTICES")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=sorted(CASES))
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help="where synthetic data is generated and kept")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative growth reported as a regression")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_CASE_TIMEOUT_S,
+                        help="seconds a case may run before it is killed and recorded as failed")
+    args = parser.parse_args(argv)
+
+    boundaries = [tuple(int(part) for part in spec.split("x")) for spec in args.boundaries]
+    # Child processes find the synthetic boundary packs through the pack directory
+    os.environ["GEODATA_PACK_DIR"] = os.path.join(args.work_dir, "packs")
+    prepare_work_dir(args.work_dir, args.sizes, boundaries)
+
+    results = []
+    print(f"{'case':<24} {'params':<44} {'wall_s':>8} {'peak_rss_mb':>12} {'payload_bytes':>14}")
+    for case, params in plan_cases(args.sizes, boundaries):
+        if case not in args.cases:
+            continue
+        result = run_case(case, params, args.work_dir, args.timeout)
+        results.append(result)
+        label = " ".join(f"{key}={value}" for key, value in params.items())
+        if "error" in result:
+            print(f"{case:<24} {label:<44} {result['error']}")
+        else:
+            print(f"{case:<24} {label:<44} {result['wall_s']:>8.3f} {result['peak_rss_mb']:>12.1f} "
+                  f"{result['payload_bytes']:>14}")
+
+    report = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "results": results,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.threshold)
+        report["regressions"] = regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression['case']} {regression['params']} {regression['metric']}: "
+                  f"{regression['baseline']} -> {regression['current']}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""Benchmark time to first paint of the Streamlit app.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--repeat 3] [--output startup_results.json]
+
+Every measurement runs the app script in a fresh process, as the first
+session of a new server would. Two scenarios are measured, each with the
+background boundary prewarm on and off:
+
+    landing  the first run of the landing page: its wall time, the time until
+             the placeholder map is emitted, and which heavy modules the script
+             itself imported (imports made by the prewarm thread do not count)
+    sample   the landing page followed by choosing the World Population sample,
+             after giving the prewarm time to finish, as a user reading the
+             landing page would; reports the wall time of that second run
+
+A run whose process crashes or outlives --timeout is listed as failed and
+left out of the medians.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+
+from pipeline_benchmark import wait_for_child
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+APP = os.path.join(ROOT, "app.py")
+
+# Modules the landing page should not need to import (pyarrow is not listed; pandas imports it)
+HEAVY_MODULES = ("geopandas", "shapely", "matplotlib.pyplot", "PIL.Image", "mapbox_vector_tile")
+
+SCENARIOS = ("landing", "sample")
+
+# Longest one measurement may run before its process is killed and the run recorded as failed
+DEFAULT_RUN_TIMEOUT_S = 900
+
+
+def _run_in_child(scenario, prewarm, results):
+    import warnings
+
+    warnings.simplefilter("ignore")
+    if not prewarm:
+        os.environ["GEODATA_PREWARM_REGIONS"] = ""
+    sys.path.insert(0, ROOT)
+    from streamlit.logger import set_log_level
+    from streamlit.testing.v1 import AppTest
+
+    set_log_level("error")
+    # Imports made by the script itself, as opposed to the background prewarm
+    script_imports = []
+    sys.addaudithook(lambda event, args: event == "import" and args[0] in HEAVY_MODULES
+                     and threading.current_thread().name != "boundary-prewarm" and script_imports.append(args[0]))
+    app = AppTest.from_file(APP, default_timeout=300)
+    start = time.perf_counter()
+    app.run()
+    result = {"landing_s": time.perf_counter() - start,
+              "first_paint_ms": app.session_state["first_paint_ms"] if "first_paint_ms" in app.session_state else None,
+              "heavy_modules": sorted(set(script_imports))}
+
+    if scenario == "sample":
+        # Give the prewarm as long as it needs, as if the user were still reading the landing page
+        for thread in threading.enumerate():
+            if thread.name == "boundary-prewarm":
+                thread.join()
+        app.sidebar.radio[0].set_value("Use sample data")
+        start = time.perf_counter()
+        app.run()
+        result["sample_s"] = time.perf_counter() - start
+        result["errors"] = [error.value for error in app.error]
+    results.put(result)
+
+
+# Function to run one scenario in a fresh process
+def run_scenario(scenario, prewarm, timeout=DEFAULT_RUN_TIMEOUT_S):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_in_child, args=(scenario, prewarm, results))
+    process.start()
+    return wait_for_child(process, results, timeout)
+
+
+# Function to reduce repeated runs to their medians; failed runs are counted and listed
+def summarize(runs):
+    failed = [run["error"] for run in runs if "error" in run]
+    runs = [run for run in runs if "error" not in run]
+    summary = {"heavy_modules": runs[0]["heavy_modules"] if runs else []}
+    if failed:
+        summary["failed_runs"] = failed
+    for name in ("landing_s", "first_paint_ms", "sample_s"):
+        values = [run[name] for run in runs if run.get(name) is not None]
+        if values:
+            summary[name] = round(statistics.median(values), 4)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=3, help="fresh processes per measurement")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_RUN_TIMEOUT_S,
+                        help="seconds a run may take before it is killed and recorded as failed")
+    parser.add_argument("--output", default="startup_results.json")
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f"{'scenario':<10} {'prewarm':<8} {'landing_s':>9} {'paint_ms':>9} {'sample_s':>9}  heavy modules imported by the script")
+    for scenario in args.scenarios:
+        for prewarm in (False, True):
+            summary = summarize([run_scenario(scenario, prewarm, args.timeout) for _ in range(args.repeat)])
+            results.append({"scenario": scenario, "prewarm": prewarm, **summary})
+            print(f"{scenario:<10} {str(prewarm):<8} {summary.get('landing_s', float('nan')):>9.2f} "
+                  f"{summary.get('first_paint_ms', float('nan')):>9.0f} {summary.get('sample_s', float('nan')):>9.2f}  "
+                  f"{', '.join(summary['heavy_modules']) or '-'}")
+            for error in summary.get("failed_runs", []):
+                print(f"    failed run: {error}")
+
+    with open(args.output, "w") as f:
+        json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                   "repeat": args.repeat, "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Vectorized spatial binning of point data.
+
+Points are assigned to square or hexagonal cells in lon/lat space with NumPy
+and reduced to per-cell counts and sums. Those sufficient statistics are all
+that is needed to derive count, sum or mean, so switching the aggregation does
+not require touching the raw points again.
+"""
+import numpy as np
+import pandas as pd
+
+GRID_TYPES = ('square', 'hexagon')
+AGGREGATIONS = ('count', 'sum', 'mean')
+
+SQRT3 = np.sqrt(3.0)
+
+
+# Function to find the square cell of every point
+def _square_cells(lat, lon, cell_size):
+    col = np.floor(lon / cell_size).astype('int64')
+    row = np.floor(lat / cell_size).astype('int64')
+    return col, row
+
+
+# Function to find the pointy-top hexagon of every point using axial coordinates
+def _hexagon_cells(lat, lon, cell_size):
+    q = (SQRT3 / 3.0 * lon - lat / 3.0) / cell_size
+    r = (2.0 / 3.0 * lat) / cell_size
+
+    # Cube rounding: round all three coordinates, then fix the one that moved most
+    s = -q - r
+    rq, rr, rs = np.rint(q), np.rint(r), np.rint(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype('int64'), rr.astype('int64')
+
+
+# Function to compute the centre of each cell
+def cell_centers(col, row, cell_size, grid='square'):
+    if grid == 'hexagon':
+        lon = cell_size * SQRT3 * (col + row / 2.0)
+        lat = cell_size * 1.5 * row
+    else:
+        lon = (col + 0.5) * cell_size
+        lat = (row + 0.5) * cell_size
+    return lat, lon
+
+
+# Function to compute the outline of each cell as [lon, lat] rings
+def cell_polygons(lat, lon, cell_size, grid='square'):
+    if grid == 'hexagon':
+        angles = np.deg2rad(np.arange(6) * 60.0 + 30.0)
+        dx, dy = cell_size * np.cos(angles), cell_size * np.sin(angles)
+    else:
+        half = cell_size / 2.0
+        dx = np.array([-half, half, half, -half])
+        dy = np.array([-half, -half, half, half])
+    ring_lon = lon[:, None] + dx[None, :]
+    ring_lat = lat[:, None] + dy[None, :]
+    rings = np.stack([ring_lon, ring_lat], axis=-1)
+    # Close each ring by repeating its first vertex
+    return np.concatenate([rings, rings[:, :1]], axis=1)
+
+
+# Function to reduce points to per-cell counts and sums
+def bin_points(lat, lon, values=None, cell_size=1.0, grid='square'):
+    if grid not in GRID_TYPES:
+        raise ValueError(f"Unknown grid type: {grid}")
+
+    lat = np.asarray(lat, dtype='float64')
+    lon = np.asarray(lon, dtype='float64')
+    if values is None:
+        values = np.zeros(len(lat))
+    values = np.asarray(values, dtype='float64')
+
+    located = np.isfinite(lat) & np.isfinite(lon)
+    lat, lon, values = lat[located], lon[located], values[located]
+
+    if grid == 'hexagon':
+        col, row = _hexagon_cells(lat, lon, cell_size)
+    else:
+        col, row = _square_cells(lat, lon, cell_size)
+
+    if len(col) == 0:
+        return pd.DataFrame({'lat': [], 'lon': [], 'count': [], 'value_count': [], 'sum': []})
+
+    # Fold both cell indices into one int64 key; a 1-D unique is much faster
+    col_min, row_min = col.min(), row.min()
+    n_rows = row.max() - row_min + 1
+    keys, inverse = np.unique((col - col_min) * n_rows + (row - row_min), return_inverse=True)
+    inverse = inverse.ravel()
+    has_value = np.isfinite(values)
+
+    count = np.bincount(inverse, minlength=len(keys))
+    value_count = np.bincount(inverse, weights=has_value, minlength=len(keys))
+    value_sum = np.bincount(inverse, weights=np.where(has_value, values, 0.0), minlength=len(keys))
+
+    center_lat, center_lon = cell_centers(keys // n_rows + col_min, keys % n_rows + row_min, cell_size, grid)
+    return pd.DataFrame({
+        'lat': center_lat,
+        'lon': center_lon,
+        'count': count,
+        'value_count': value_count.astype('int64'),
+        'sum': value_sum,
+    })
+
+
+# Function to derive the requested statistic from per-cell counts and sums
+def aggregate_bins(bins, how='count'):
+    if how == 'count':
+        return bins['count'].astype('float64')
+    if how == 'sum':
+        return bins['sum']
+    if how == 'mean':
+        return bins['sum'] / bins['value_count'].where(bins['value_count'] > 0)
+    raise ValueError(f"Unknown aggregation: {how}")
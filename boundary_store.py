@@ -0,0 +1,306 @@
+"""Preprocessed boundary packs that are memory-mapped at runtime.
+
+A pack is built once from a boundary source (shapefile, GeoJSON, ...) and
+holds only what the app needs: normalized code columns, a handful of name
+attributes, WKB geometry at full resolution and at every simplified level of
+detail, and per-feature bounding boxes in an uncompressed Arrow IPC file,
+plus a uniform-grid spatial index stored as .npy arrays.
+Opening a pack memory-maps those files, so the bytes are shared through the
+OS page cache by every process and session instead of being parsed again.
+Bounding-box lookups are answered from the grid index and the bounds
+columns alone, and WKB is only decoded for the features a caller asks for,
+so a viewport query touches the geometry of the regions in view and nothing
+else.
+
+Build packs ahead of time with:
+    python boundary_store.py [region_type ...]
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import geopandas as gpd
+import numpy as np
+import pyarrow as pa
+import shapely
+
+from geometry_lod import LOD_TOLERANCES, build_lod_levels
+
+# Bundled boundary files live next to the code, whatever the working directory
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+PACK_DIR = os.environ.get("GEODATA_PACK_DIR", os.path.join(SOURCE_DIR, "boundary_packs"))
+PACK_VERSION = 2
+
+# Boundary sources that can be packed. Each normalized code column is filled
+# from the first source column holding a usable value for that feature.
+BOUNDARY_SOURCES = {
+    "world": {
+        "path": os.path.join(SOURCE_DIR, "ne_110m_admin_0_countries.shp"),
+        "codes": {
+            "country_code": ["ISO_A3", "ISO_A3_EH", "ADM0_A3"],
+            "iso_a2": ["ISO_A2", "ISO_A2_EH"],
+            "iso_n3": ["ISO_N3", "ISO_N3_EH"],
+        },
+        "attributes": ["ISO_A3", "ADM0_A3", "ADMIN", "NAME", "NAME_LONG", "FORMAL_EN", "CONTINENT"],
+    },
+    "us_states": {
+        "path": os.path.join(SOURCE_DIR, "us_states.shp"),
+        "codes": {
+            "state_code": ["STUSPS", "id"],
+            "state_fips": ["STATEFP"],
+        },
+        "attributes": ["NAME", "name"],
+    },
+}
+
+# Code values Natural Earth and others use for "not assigned"
+MISSING_CODES = {"", "-99", "-1", "NONE", "NULL", "NAN"}
+
+# Target number of features per index cell, and the largest grid side
+INDEX_FEATURES_PER_CELL = 4
+INDEX_MAX_CELLS_PER_SIDE = 1024
+
+FEATURES_FILE = "features.arrow"
+INDEX_OFFSETS_FILE = "index_offsets.npy"
+INDEX_IDS_FILE = "index_ids.npy"
+META_FILE = "meta.json"
+
+
+# Function to return the directory a region's pack lives in
+def pack_path(region_type, pack_dir=PACK_DIR):
+    return os.path.join(pack_dir, f"{region_type}.pack")
+
+
+# Function to name the pack column holding the geometry simplified to a tolerance
+def geometry_column(tolerance):
+    return "geometry" if tolerance <= 0 else f"geometry_lod_{tolerance:g}"
+
+
+# Function to return the code column data is joined on for a region type
+def region_code_column(region_type):
+    codes = BOUNDARY_SOURCES.get(region_type, {}).get("codes")
+    return next(iter(codes)) if codes else None
+
+
+# Function to build one normalized code column from its candidate source columns
+def normalize_codes(geo_data, source_columns):
+    codes = np.full(len(geo_data), None, dtype=object)
+    for col in source_columns:
+        if col not in geo_data.columns:
+            continue
+        values = geo_data[col].astype(str).str.strip().str.upper()
+        usable = geo_data[col].notna().to_numpy() & ~values.isin(MISSING_CODES).to_numpy()
+        fill = usable & (codes == None)  # noqa: E711
+        codes[fill] = values.to_numpy()[fill]
+    return codes
+
+
+# Function to build a uniform-grid index mapping each cell to the features touching it
+def build_grid_index(bounds):
+    n = len(bounds)
+    extent = (bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()) if n else (0, 0, 1, 1)
+    side = int(np.clip(np.ceil(np.sqrt(max(n, 1) / INDEX_FEATURES_PER_CELL)), 1, INDEX_MAX_CELLS_PER_SIDE))
+    cell_w = max((extent[2] - extent[0]) / side, 1e-9)
+    cell_h = max((extent[3] - extent[1]) / side, 1e-9)
+    grid = {"origin_x": float(extent[0]), "origin_y": float(extent[1]),
+            "cell_width": float(cell_w), "cell_height": float(cell_h), "cols": side, "rows": side}
+
+    ix0, iy0, ix1, iy1 = _cell_ranges(grid, bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3])
+    nx, ny = ix1 - ix0 + 1, iy1 - iy0 + 1
+    counts = nx * ny
+
+    # Expand every feature to the cells its bounding box covers, without a Python loop
+    features = np.repeat(np.arange(n, dtype="int64"), counts)
+    local = np.arange(counts.sum(), dtype="int64") - np.repeat(np.cumsum(counts) - counts, counts)
+    cells = (iy0[features] + local // nx[features]) * side + ix0[features] + local % nx[features]
+
+    order = np.argsort(cells, kind="stable")
+    ids = features[order].astype("int32")
+    offsets = np.searchsorted(cells[order], np.arange(side * side + 1)).astype("int64")
+    return grid, offsets, ids
+
+
+def _cell_ranges(grid, minx, miny, maxx, maxy):
+    def clamp(values, limit):
+        return np.clip(values, 0, limit - 1).astype("int64")
+
+    ix0 = clamp(np.floor((np.asarray(minx) - grid["origin_x"]) / grid["cell_width"]), grid["cols"])
+    ix1 = clamp(np.floor((np.asarray(maxx) - grid["origin_x"]) / grid["cell_width"]), grid["cols"])
+    iy0 = clamp(np.floor((np.asarray(miny) - grid["origin_y"]) / grid["cell_height"]), grid["rows"])
+    iy1 = clamp(np.floor((np.asarray(maxy) - grid["origin_y"]) / grid["cell_height"]), grid["rows"])
+    return ix0, iy0, ix1, iy1
+
+
+# Function to convert a boundary GeoDataFrame into a pack on disk
+def build_boundary_pack(geo_data, region_type, codes=None, attributes=None, pack_dir=PACK_DIR):
+    source = BOUNDARY_SOURCES.get(region_type, {})
+    codes = source.get("codes", {}) if codes is None else codes
+    attributes = source.get("attributes", []) if attributes is None else attributes
+
+    if geo_data.crs is not None and geo_data.crs.to_epsg() != 4326:
+        geo_data = geo_data.to_crs(epsg=4326)
+
+    geometry = geo_data.geometry.to_numpy()
+    bounds = shapely.bounds(geometry)
+
+    columns = {}
+    for code_column, source_columns in codes.items():
+        columns[code_column] = pa.array(normalize_codes(geo_data, source_columns), type=pa.string())
+    for col in attributes:
+        if col in geo_data.columns and col not in columns:
+            columns[col] = pa.array(geo_data[col].astype(object).where(geo_data[col].notna(), None).tolist())
+    for i, name in enumerate(("minx", "miny", "maxx", "maxy")):
+        columns[name] = pa.array(bounds[:, i])
+    # Every level of detail is simplified once here, so no process simplifies at runtime
+    for tolerance, level in build_lod_levels(geo_data[[geo_data.geometry.name]], LOD_TOLERANCES).items():
+        columns[geometry_column(tolerance)] = pa.array(shapely.to_wkb(level.geometry.to_numpy()), type=pa.binary())
+    table = pa.table(columns)
+
+    grid, offsets, ids = build_grid_index(bounds)
+
+    final_path = pack_path(region_type, pack_dir)
+    os.makedirs(pack_dir, exist_ok=True)
+    # Written into a private sibling and moved into place whole, so a concurrent or interrupted
+    # build never leaves a partial pack where open_boundary_pack looks
+    path = tempfile.mkdtemp(dir=pack_dir, prefix=f".{region_type}.", suffix=".tmp")
+    try:
+        # mkdtemp makes the directory private; the installed pack is read by every app process
+        os.chmod(path, 0o755)
+        # Uncompressed IPC so the file can be memory-mapped without decoding
+        with pa.OSFile(os.path.join(path, FEATURES_FILE), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        np.save(os.path.join(path, INDEX_OFFSETS_FILE), offsets)
+        np.save(os.path.join(path, INDEX_IDS_FILE), ids)
+        with open(os.path.join(path, META_FILE), "w") as f:
+            json.dump({"version": PACK_VERSION, "region_type": region_type, "crs": "EPSG:4326",
+                       "code_columns": list(codes), "features": len(table),
+                       "lod_tolerances": list(LOD_TOLERANCES), "grid": grid}, f, indent=2)
+        install_pack(path, final_path)
+    except BaseException:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    return final_path
+
+
+# Function to move a fully written pack into place, replacing any earlier build
+def install_pack(built_path, final_path):
+    try:
+        os.rename(built_path, final_path)
+        return
+    except OSError:
+        if not os.path.isdir(final_path):
+            raise
+    # The old pack is moved aside first; processes that mapped it keep their open files
+    retired_path = f"{built_path}.retired"
+    os.rename(final_path, retired_path)
+    os.rename(built_path, final_path)
+    shutil.rmtree(retired_path, ignore_errors=True)
+
+
+class BoundaryPack:
+    """Read-only, memory-mapped view of a boundary pack."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != PACK_VERSION:
+            raise ValueError(f"Boundary pack {path} has version {self.meta.get('version')}, expected {PACK_VERSION}")
+
+        self.path = path
+        self.table = pa.ipc.open_file(pa.memory_map(os.path.join(path, FEATURES_FILE), "r")).read_all()
+        self.index_offsets = np.load(os.path.join(path, INDEX_OFFSETS_FILE), mmap_mode="r")
+        self.index_ids = np.load(os.path.join(path, INDEX_IDS_FILE), mmap_mode="r")
+        self.bounds = np.column_stack([self.table.column(name).to_numpy() for name in ("minx", "miny", "maxx", "maxy")])
+        self.tolerances = tuple(self.meta.get("lod_tolerances", (0.0,)))
+        self._levels = {}
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def has_level(self, tolerance):
+        return tolerance in self.tolerances
+
+    @property
+    def geometry(self):
+        return self.level_geometry(0.0)
+
+    def level_geometry(self, tolerance):
+        # A level's WKB is decoded once per process, on first use, for callers that need every feature
+        if tolerance not in self._levels:
+            column = self.table.column(geometry_column(tolerance))
+            self._levels[tolerance] = shapely.from_wkb(column.to_numpy(zero_copy_only=False))
+        return self._levels[tolerance]
+
+    def geometry_at(self, rows, tolerance=0.0):
+        if tolerance in self._levels:
+            return self._levels[tolerance][rows]
+        # Only the requested features are decoded; the rest stay as mapped bytes
+        column = self.table.column(geometry_column(tolerance))
+        return shapely.from_wkb(column.take(pa.array(rows)).to_numpy(zero_copy_only=False))
+
+    def attribute_names(self):
+        skip = {geometry_column(tolerance) for tolerance in self.tolerances} | {"minx", "miny", "maxx", "maxy"}
+        return [name for name in self.table.column_names if name not in skip]
+
+    def attributes(self):
+        return self.table.select(self.attribute_names()).to_pandas()
+
+    def query_bbox(self, minx, miny, maxx, maxy):
+        grid = self.meta["grid"]
+        ix0, iy0, ix1, iy1 = _cell_ranges(grid, minx, miny, maxx, maxy)
+        cells = (np.arange(iy0, iy1 + 1)[:, None] * grid["cols"] + np.arange(ix0, ix1 + 1)[None, :]).ravel()
+        # Every cell's slice of feature ids, gathered without a Python loop over the cells
+        starts, stops = self.index_offsets[cells], self.index_offsets[cells + 1]
+        counts = stops - starts
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidates = np.unique(self.index_ids[np.repeat(starts, counts) + local])
+        b = self.bounds[candidates]
+        hit = (b[:, 0] <= maxx) & (b[:, 2] >= minx) & (b[:, 1] <= maxy) & (b[:, 3] >= miny)
+        return candidates[hit]
+
+    def to_geodataframe(self, rows=None, tolerance=0.0):
+        attributes = self.table.select(self.attribute_names())
+        if rows is None:
+            geometry = self.level_geometry(tolerance)
+        else:
+            attributes = attributes.take(pa.array(rows))
+            geometry = self.geometry_at(rows, tolerance)
+        return gpd.GeoDataFrame(attributes.to_pandas(), geometry=geometry, crs=self.meta.get("crs"))
+
+
+# Function to open a region's pack, or return None when it has not been built or is outdated
+def open_boundary_pack(region_type, pack_dir=PACK_DIR):
+    path = pack_path(region_type, pack_dir)
+    try:
+        with open(os.path.join(path, META_FILE)) as f:
+            version = json.load(f).get("version")
+    except FileNotFoundError:
+        return None
+    # A pack from an older build is rebuilt like a missing one
+    if version != PACK_VERSION:
+        return None
+    return BoundaryPack(path)
+
+
+# Function to build the pack for a known region from its local source file
+def build_region_pack(region_type, pack_dir=PACK_DIR):
+    source = BOUNDARY_SOURCES[region_type]
+    geo_data = gpd.read_file(source["path"])
+    return build_boundary_pack(geo_data, region_type, pack_dir=pack_dir)
+
+
+def main(argv=None):
+    regions = (argv if argv is not None else sys.argv[1:]) or list(BOUNDARY_SOURCES)
+    for region_type in regions:
+        if not os.path.exists(BOUNDARY_SOURCES[region_type]["path"]):
+            print(f"{region_type}: source {BOUNDARY_SOURCES[region_type]['path']} not found, skipped")
+            continue
+        path = build_region_pack(region_type)
+        print(f"{region_type}: {len(open_boundary_pack(region_type))} features -> {path}")
+
+
+if __name__ == "__main__":
+    main()
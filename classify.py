@@ -0,0 +1,141 @@
+"""Vectorized classification of map values into color classes.
+
+Breaks are computed once per column and scheme and shared by the choropleth
+and point renderers, so the same value gets the same color on every map of
+a dataset. Equal-interval, quantile and standard-deviation breaks are single
+NumPy passes. Natural breaks (Jenks) minimize the squared deviation within
+classes with Fisher's dynamic program, run on a fixed-size sample of the
+values, so its cost does not grow with the number of rows. Breaks are the
+class edges from the minimum to the maximum; schemes that would produce
+empty classes on repetitive data return fewer classes instead.
+"""
+import numpy as np
+from branca.colormap import StepColormap
+from branca.utilities import color_brewer
+
+CLASSIFICATION_SCHEMES = {
+    "quantile": "Quantile",
+    "equal_interval": "Equal interval",
+    "std_dev": "Standard deviation",
+    "natural_breaks": "Natural breaks (Jenks)",
+}
+
+# Scheme and class count the app starts with; the batch renderer uses the same, so a map has the
+# same breaks whichever draws it
+DEFAULT_SCHEME = "quantile"
+DEFAULT_CLASSES = 6
+
+# Values natural breaks are computed on; the dynamic program is quadratic in this
+JENKS_SAMPLE_SIZE = 1000
+
+
+# Function to return the finite values of a column as float64
+def finite_values(values):
+    values = np.asarray(values, dtype='float64')
+    return values[np.isfinite(values)]
+
+
+# Function to compute equal-interval breaks
+def equal_interval_breaks(values, classes):
+    return np.linspace(values.min(), values.max(), classes + 1)
+
+
+# Function to compute breaks that put the same number of values in every class
+def quantile_breaks(values, classes):
+    return np.quantile(values, np.linspace(0.0, 1.0, classes + 1))
+
+
+# Function to compute breaks one standard deviation wide, centred on the mean
+def std_dev_breaks(values, classes):
+    std = values.std()
+    if std == 0:
+        return np.array([values.min(), values.max()])
+    inner = values.mean() + (np.arange(1, classes) - classes / 2) * std
+    inner = inner[(inner > values.min()) & (inner < values.max())]
+    return np.concatenate([[values.min()], inner, [values.max()]])
+
+
+# Function to compute natural breaks (Jenks) with Fisher's dynamic program on a sample of the values
+def natural_breaks(values, classes, sample_size=JENKS_SAMPLE_SIZE, seed=0):
+    if len(values) > sample_size:
+        sample = np.random.default_rng(seed).choice(values, sample_size - 2, replace=False)
+        # The extremes always bound the classes, sampled or not
+        values = np.concatenate([sample, [values.min(), values.max()]])
+    values = np.sort(values)
+    n = len(values)
+    classes = min(classes, len(np.unique(values)))
+    if classes < 2:
+        return np.array([values[0], values[-1]])
+
+    # Squared deviation of every run values[start:stop + 1], from prefix sums, as one n x n matrix
+    sums = np.concatenate([[0.0], np.cumsum(values)])
+    squares = np.concatenate([[0.0], np.cumsum(values ** 2)])
+    start = np.arange(n)[:, None]
+    stop = np.arange(1, n + 1)[None, :]
+    count = np.maximum(stop - start, 1)
+    deviation = squares[stop] - squares[start] - (sums[stop] - sums[start]) ** 2 / count
+    deviation = np.where(stop > start, np.maximum(deviation, 0.0), np.inf)
+
+    # cost[last] is the least total deviation of values[:last + 1] split into the classes so far;
+    # each added class is the best last run values[first:last + 1] after an optimal prefix
+    cost = deviation[0]
+    firsts = []
+    for _ in range(1, classes):
+        total = cost[:-1, None] + deviation[1:]
+        best = np.argmin(total, axis=0)
+        cost = total[best, np.arange(n)]
+        firsts.append(best + 1)
+
+    # Walk the chosen class starts back from the last value; breaks fall midway between classes
+    edges = [values[-1]]
+    last = n - 1
+    for first in reversed(firsts):
+        edges.append((values[first[last] - 1] + values[first[last]]) / 2)
+        last = first[last] - 1
+    edges.append(values[0])
+    return np.array(edges[::-1])
+
+
+BREAK_FUNCTIONS = {
+    "quantile": quantile_breaks,
+    "equal_interval": equal_interval_breaks,
+    "std_dev": std_dev_breaks,
+    "natural_breaks": natural_breaks,
+}
+
+
+# Function to compute class breaks for a column with the given scheme
+def compute_breaks(values, scheme="equal_interval", classes=DEFAULT_CLASSES):
+    if scheme not in BREAK_FUNCTIONS:
+        raise ValueError(f"Unknown classification scheme: {scheme}")
+    values = finite_values(values)
+    if len(values) == 0:
+        return np.linspace(0.0, 1.0, classes + 1)
+    if values.min() == values.max():
+        return np.array([values.min(), values.max()])
+    # Repeated values can make edges coincide; those classes would always be empty
+    return np.unique(BREAK_FUNCTIONS[scheme](values, classes))
+
+
+# Function to assign every value its class in one pass; the slot after the last class is for missing values
+def classify_values(values, edges):
+    values = np.asarray(values, dtype='float64')
+    classes = max(len(edges) - 1, 1)
+    indices = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, classes - 1)
+    indices[~np.isfinite(values)] = classes
+    return indices.astype('uint8')
+
+
+# Function to pick one ColorBrewer color per class, light to dark
+def class_palette(color_scheme, classes):
+    colors = color_brewer(color_scheme, n=max(classes, 3))
+    return [colors[i] for i in np.linspace(0, len(colors) - 1, classes).round().astype(int)]
+
+
+# Function to build a stepped colormap over class breaks, usable as a legend
+def stepped_colormap(edges, color_scheme, caption=""):
+    classes = max(len(edges) - 1, 1)
+    if len(edges) < 2:
+        edges = [edges[0], edges[0]]
+    return StepColormap(class_palette(color_scheme, classes), index=list(edges), vmin=edges[0], vmax=edges[-1],
+                        caption=caption)
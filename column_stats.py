@@ -0,0 +1,248 @@
+"""Mergeable streaming summaries for numeric columns.
+
+A ColumnSummary is built chunk by chunk and two summaries merge into one, so
+the same code summarizes a frame that is already loaded and a file that is
+still being read in chunks. It keeps exact moments (count, mean, variance,
+min, max), a t-digest for approximate quantiles and a fixed-width histogram
+whose power-of-two bin width doubles as the range grows. Summaries are kept
+per data fingerprint and column in a small shared store, so the statistics
+panel never touches the raw values again after the first pass.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHUNK_ROWS = 1_000_000
+
+# t-digest compression: centroids stay around this count, tails stay sharp
+DIGEST_COMPRESSION = 200
+
+# The histogram keeps at most this many bins; doubling the width halves them
+HISTOGRAM_MAX_BINS = 64
+
+SUMMARY_STORE_ENTRIES = 256
+
+
+class TDigest:
+    """Merging t-digest with the arcsine scale function, built with NumPy."""
+
+    def __init__(self, compression=DIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+
+    @property
+    def total(self):
+        return float(self.weights.sum())
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        if total == 0:
+            self.means, self.weights = means, weights
+            return
+
+        # Each centroid may cover at most one unit of the scale k(q)
+        q_left = (np.cumsum(weights) - weights) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * np.clip(q_left, 0.0, 1.0) - 1)
+        groups = np.floor(k - k[0]).astype("int64")
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+
+        merged_weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / merged_weights
+        self.weights = merged_weights
+
+    def update(self, values):
+        values = np.asarray(values, dtype="float64")
+        if len(values) == 0:
+            return self
+        self._compress(np.concatenate([self.means, values]),
+                       np.concatenate([self.weights, np.ones(len(values))]))
+        return self
+
+    def merge(self, other):
+        self._compress(np.concatenate([self.means, other.means]),
+                       np.concatenate([self.weights, other.weights]))
+        return self
+
+    def quantile(self, q, vmin, vmax):
+        total = self.total
+        if total == 0:
+            return np.full(np.shape(q), np.nan)
+        # Interpolate between centroid midpoints, pinned to the exact extremes
+        mids = np.cumsum(self.weights) - self.weights / 2
+        positions = np.r_[0.0, mids, total]
+        values = np.r_[vmin, self.means, vmax]
+        return np.interp(np.asarray(q) * total, positions, values)
+
+
+class ColumnSummary:
+    """Exact moments, t-digest quantiles and a fixed-width histogram of one column."""
+
+    def __init__(self, compression=DIGEST_COMPRESSION, max_bins=HISTOGRAM_MAX_BINS):
+        self.count = 0
+        self.missing = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.digest = TDigest(compression)
+        self.max_bins = max_bins
+        # Bin i covers [(first_bin + i) * bin_width, (first_bin + i + 1) * bin_width)
+        self.bin_width = None
+        self.first_bin = 0
+        self.bin_counts = np.empty(0, dtype="int64")
+
+    def _merge_moments(self, count, mean, m2, vmin, vmax):
+        # Chan et al. parallel update of mean and sum of squared deviations
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = min(self.min, vmin)
+        self.max = max(self.max, vmax)
+
+    def _coarsen(self, bin_width):
+        # Doubling the width folds pairs of bins; floor division keeps negative bins aligned
+        while self.bin_width < bin_width:
+            self.bin_width *= 2
+            last_bin = self.first_bin + len(self.bin_counts) - 1
+            first, last = self.first_bin // 2, last_bin // 2
+            counts = np.zeros(last - first + 1, dtype="int64")
+            np.add.at(counts, np.arange(self.first_bin, last_bin + 1) // 2 - first, self.bin_counts)
+            self.first_bin, self.bin_counts = first, counts
+
+    def _add_bins(self, first_bin, bin_counts):
+        if len(self.bin_counts) == 0:
+            self.first_bin, self.bin_counts = first_bin, np.asarray(bin_counts, dtype="int64").copy()
+            return
+        last_bin = max(self.first_bin + len(self.bin_counts), first_bin + len(bin_counts)) - 1
+        first = min(self.first_bin, first_bin)
+        counts = np.zeros(last_bin - first + 1, dtype="int64")
+        counts[self.first_bin - first:self.first_bin - first + len(self.bin_counts)] += self.bin_counts
+        counts[first_bin - first:first_bin - first + len(bin_counts)] += bin_counts
+        self.first_bin, self.bin_counts = first, counts
+
+    def _fit_bins(self):
+        while len(self.bin_counts) > self.max_bins:
+            self._coarsen(self.bin_width * 2)
+
+    def update(self, values):
+        values = pd.Series(values).to_numpy(dtype="float64", na_value=np.nan)
+        finite = values[np.isfinite(values)]
+        self.missing += len(values) - len(finite)
+        if len(finite) == 0:
+            return self
+
+        vmin, vmax = float(finite.min()), float(finite.max())
+        self._merge_moments(len(finite), float(finite.mean()), float(((finite - finite.mean()) ** 2).sum()),
+                            vmin, vmax)
+        self.digest.update(finite)
+
+        # Bin widths are powers of two, so any two summaries can be brought to a common width
+        span = max(self.max - self.min, max(abs(self.min), abs(self.max)) * 1e-9, 1e-300)
+        width = 2.0 ** np.ceil(np.log2(span / self.max_bins))
+        if self.bin_width is None:
+            self.bin_width = width
+        elif width > self.bin_width:
+            self._coarsen(width)
+        bins = np.floor(finite / self.bin_width).astype("int64")
+        first_bin = int(bins.min())
+        self._add_bins(first_bin, np.bincount(bins - first_bin))
+        self._fit_bins()
+        return self
+
+    def merge(self, other):
+        self.missing += other.missing
+        if other.count == 0:
+            return self
+        self._merge_moments(other.count, other.mean, other.m2, other.min, other.max)
+        self.digest.merge(other.digest)
+
+        if self.bin_width is None:
+            self.bin_width, self.first_bin, self.bin_counts = other.bin_width, other.first_bin, other.bin_counts.copy()
+        else:
+            other_first, other_counts = other.first_bin, other.bin_counts
+            if other.bin_width < self.bin_width:
+                # Coarsen a copy of the other histogram to this width
+                copy = ColumnSummary(max_bins=np.inf)
+                copy.bin_width, copy.first_bin, copy.bin_counts = other.bin_width, other_first, other_counts
+                copy._coarsen(self.bin_width)
+                other_first, other_counts = copy.first_bin, copy.bin_counts
+            else:
+                self._coarsen(other.bin_width)
+            self._add_bins(other_first, other_counts)
+        self._fit_bins()
+        return self
+
+    def quantiles(self, q):
+        return self.digest.quantile(q, self.min, self.max)
+
+    def histogram(self):
+        # Trim empty bins at the edges so the chart spans the data
+        nonzero = np.flatnonzero(self.bin_counts)
+        if len(nonzero) == 0:
+            return np.empty(0, dtype="int64"), np.empty(0)
+        counts = self.bin_counts[nonzero[0]:nonzero[-1] + 1]
+        edges = (self.first_bin + nonzero[0] + np.arange(len(counts) + 1)) * self.bin_width
+        return counts, edges
+
+    def describe(self):
+        # Same labels as pandas' describe(), with approximate quartiles
+        std = np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+        quartiles = self.quantiles([0.25, 0.5, 0.75]) if self.count else [np.nan] * 3
+        return pd.Series(
+            [self.count, self.mean if self.count else np.nan, std,
+             self.min if self.count else np.nan, *quartiles, self.max if self.count else np.nan],
+            index=["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+        )
+
+
+# Function to summarize a column that is already loaded, one chunk at a time
+def summarize_column(values, chunk_rows=DEFAULT_CHUNK_ROWS):
+    summary = ColumnSummary()
+    for start in range(0, len(values), chunk_rows):
+        summary.update(values[start:start + chunk_rows])
+    return summary
+
+
+# Function to fold one ingested chunk into per-column summaries
+def update_summaries(summaries, chunk):
+    for col in chunk.columns:
+        if pd.api.types.is_numeric_dtype(chunk[col]) and not pd.api.types.is_bool_dtype(chunk[col]):
+            summaries.setdefault(col, ColumnSummary()).update(chunk[col])
+    return summaries
+
+
+class SummaryStore:
+    """Thread-safe LRU of column summaries keyed by data fingerprint and column."""
+
+    def __init__(self, max_entries=SUMMARY_STORE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint, column):
+        with self._lock:
+            summary = self._entries.get((fingerprint, column))
+            if summary is not None:
+                self._entries.move_to_end((fingerprint, column))
+            return summary
+
+    def put(self, fingerprint, column, summary):
+        with self._lock:
+            self._entries[(fingerprint, column)] = summary
+            self._entries.move_to_end((fingerprint, column))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return summary
+
+    def get_or_compute(self, fingerprint, column, values):
+        summary = self.get(fingerprint, column)
+        if summary is None:
+            summary = self.put(fingerprint, column, summarize_column(values))
+        return summary
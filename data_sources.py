@@ -0,0 +1,353 @@
+"""Data loaders shared by the Streamlit app and the batch renderer.
+
+Boundary sets, sample datasets, parsed uploads and derived tables (spatial
+aggregates, point bins) are loaded here behind Streamlit's caches. Outside a
+Streamlit server the caches fall back to per-process memory, so headless
+callers get the same loading and fallback behavior as the app.
+"""
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from binning import bin_points
+from classify import compute_breaks
+from column_stats import update_summaries
+from gazetteer import Gazetteer
+from boundary_store import BOUNDARY_SOURCES, build_region_pack, open_boundary_pack, region_code_column
+from geometry_lod import LOD_TOLERANCES, simplify_boundaries
+from ingest import (DEFAULT_MEMORY_BUDGET_MB, STREAMING_EXTENSIONS, MemoryBudgetExceeded,
+                    compact_frame, read_tabular_chunked)
+from rollup import ROLLUP_EXTENSIONS, rollup_file
+from spatial_join import aggregate_points_by_region, build_region_index
+from vector_io import PARQUET_EXTENSIONS, VECTOR_EXTENSIONS, read_vector
+from viewport import PointIndex, select_pack_regions, select_regions
+
+# Boundary sets most sessions start with, loaded in the background at server start;
+# GEODATA_PREWARM_REGIONS overrides the comma-separated list and an empty value turns it off
+PREWARM_REGIONS = tuple(filter(None, os.environ.get("GEODATA_PREWARM_REGIONS", "world,us_states").split(",")))
+
+# Function to open the memory-mapped boundary pack for a region, building it once if needed
+@st.cache_resource(show_spinner=False)
+def load_boundary_pack(region_type):
+    pack = open_boundary_pack(region_type)
+    if pack is None and region_type in BOUNDARY_SOURCES and os.path.exists(BOUNDARY_SOURCES[region_type]["path"]):
+        try:
+            build_region_pack(region_type)
+            pack = open_boundary_pack(region_type)
+        except Exception as e:
+            st.warning(f"Could not build boundary pack for {region_type}: {str(e)}")
+    return pack
+
+# Function to load GeoJSON/Shapefile; the result is shared read-only by all sessions
+@st.cache_resource
+def load_geo_data(region_type):
+    pack = load_boundary_pack(region_type)
+    if pack is not None:
+        return pack.to_geodataframe()
+    
+    if region_type == "world":
+        try:
+            # Try to load local shapefile first
+            world = gpd.read_file(BOUNDARY_SOURCES["world"]["path"])
+            # Check for common country code columns and standardize
+            if 'ISO_A3' in world.columns:
+                world['country_code'] = world['ISO_A3']
+            elif 'ADM0_A3' in world.columns:
+                world['country_code'] = world['ADM0_A3']
+            # Add more mappings as needed
+            
+            st.success("Loaded local Natural Earth data")
+            return world
+        except Exception as e:
+            st.warning(f"Could not load local shapefile: {str(e)}. Trying online source...")
+            
+            # Fallback to online source
+            world_url = "https://raw.githubusercontent.com/datasets/geo-boundaries-world-110m/master/countries.geojson"
+            world = gpd.read_file(world_url)
+            
+            # Inspect the GeoJSON properties to find the correct identifier
+            if len(world) > 0:
+                sample_props = world.iloc[0]
+                if hasattr(sample_props, '__geo_interface__'):
+                    st.info(f"Available properties in GeoJSON: {list(sample_props.__geo_interface__['properties'].keys())}")
+                
+                # Map common country code fields
+                if 'iso_a3' in world.columns:
+                    world['country_code'] = world['iso_a3']
+                elif 'ISO_A3' in world.columns:
+                    world['country_code'] = world['ISO_A3']
+                elif 'id' in world.columns:
+                    world['country_code'] = world['id']
+                # If no known country code column exists, add a warning
+                else:
+                    st.warning("Could not identify a country code column. Map may not display correctly.")
+            
+            return world
+    elif region_type == "us_states":
+        try:
+            # Try local file first
+            states = gpd.read_file(BOUNDARY_SOURCES["us_states"]["path"])
+            if 'STUSPS' in states.columns:
+                states['state_code'] = states['STUSPS']
+            return states
+        except Exception as e:
+            st.warning(f"Could not load local US states file: {str(e)}. Trying online source...")
+            
+            # Fallback to online source
+            us_states_url = "https://raw.githubusercontent.com/PublicaMundi/MappingAPI/master/data/geojson/us-states.json"
+            states = gpd.read_file(us_states_url)
+            
+            # Fix field mappings if needed
+            if 'id' in states.columns:
+                states['state_code'] = states['id']
+                
+            return states
+    else:
+        st.error(f"Unknown region type: {region_type}")
+        return None
+
+# Function to load the attribute table of a region type's boundaries, without their geometry
+@st.cache_resource(show_spinner=False)
+def load_region_table(region_type):
+    pack = load_boundary_pack(region_type)
+    if pack is not None:
+        # Read from the pack's columns, so no WKB is decoded
+        return pack.attributes()
+    geo_data = load_geo_data(region_type)
+    if geo_data is None:
+        return None
+    return pd.DataFrame(geo_data.drop(columns=geo_data.geometry.name))
+
+# Function to load boundary sets and one simplified level into the shared caches ahead of use
+def prewarm_boundaries(region_types=PREWARM_REGIONS, tolerance=None):
+    for region_type in region_types:
+        try:
+            # Only boundaries available locally; online fallbacks are left to the session that needs them
+            if load_boundary_pack(region_type) is None:
+                continue
+            load_region_table(region_type)
+            if tolerance is not None:
+                load_simplified_geo_data(region_type, tolerance)
+        except Exception:
+            # The session that needs these boundaries will load them and report the error itself
+            pass
+
+# Function to load a boundary set simplified to the given tolerance
+@st.cache_resource(max_entries=len(LOD_TOLERANCES) * 2, show_spinner=False)
+def load_simplified_geo_data(region_type, tolerance):
+    pack = load_boundary_pack(region_type)
+    if pack is not None and pack.has_level(tolerance):
+        # Simplified when the pack was built
+        return pack.to_geodataframe(tolerance=tolerance)
+    geo_data = load_geo_data(region_type)
+    if geo_data is None:
+        return None
+    return simplify_boundaries(geo_data, tolerance)
+
+# Function to build the spatial index the point join tests region geometry against, once per process
+@st.cache_resource(show_spinner=False)
+def load_region_index(region_type):
+    pack = load_boundary_pack(region_type)
+    if pack is not None:
+        # Straight from the pack's geometry, without building an attribute frame beside it
+        return build_region_index(pack.geometry)
+    return build_region_index(load_geo_data(region_type).geometry.to_numpy())
+
+# Function to build the spatial index over an uploaded boundary file once per data fingerprint
+@st.cache_resource(max_entries=8, show_spinner=False)
+def load_upload_region_index(_geo_data, data_fingerprint):
+    return build_region_index(_geo_data.geometry.to_numpy())
+
+# Function to pick the rows of a region type's boundaries around a viewport
+def select_view_regions(region_type, viewport):
+    pack = load_boundary_pack(region_type)
+    if pack is None:
+        return select_regions(load_region_index(region_type), viewport)
+    return select_pack_regions(pack, viewport)
+
+# Function to load the regions with the given row numbers, simplified to a tolerance
+def load_region_rows(region_type, rows, tolerance):
+    pack = load_boundary_pack(region_type)
+    if pack is None:
+        return load_simplified_geo_data(region_type, tolerance).iloc[rows]
+    # Only these rows' geometry is decoded from the pack, at a level it already holds when it can
+    if pack.has_level(tolerance):
+        return pack.to_geodataframe(rows, tolerance)
+    return simplify_boundaries(pack.to_geodataframe(rows), tolerance)
+
+# Function to index point positions for viewport queries once per data fingerprint and columns
+@st.cache_resource(max_entries=8, show_spinner="Indexing points...")
+def load_point_index(_data, data_fingerprint, lat_column, lon_column):
+    return PointIndex(
+        _data[lat_column].to_numpy(dtype='float64', na_value=np.nan),
+        _data[lon_column].to_numpy(dtype='float64', na_value=np.nan)
+    )
+
+# Function to build the name and code gazetteer over a region type's boundaries once per key column
+@st.cache_resource(max_entries=8, show_spinner=False)
+def load_gazetteer(region_type, key_column):
+    return Gazetteer(load_region_table(region_type), key_column)
+
+# Function to translate a join column into boundary keys once per data fingerprint
+@st.cache_resource(max_entries=16, show_spinner="Matching regions...")
+def load_region_matches(_data, data_fingerprint, join_column, region_type, key_column):
+    return load_gazetteer(region_type, key_column).match(_data[join_column])
+
+# Function to compute a column's class breaks once per data fingerprint, scheme and class count
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_breaks(_data, data_fingerprint, value_column, scheme, classes):
+    return compute_breaks(_data[value_column].to_numpy(dtype='float64', na_value=np.nan), scheme, classes)
+
+# Function to aggregate point data into regions; the data is identified by its fingerprint
+@st.cache_data(max_entries=16, show_spinner="Joining points to regions...")
+def load_region_aggregates(_data, data_fingerprint, lat_column, lon_column, value_column, region_type, aggregation):
+    return aggregate_points_by_region(
+        _data,
+        lat_column,
+        lon_column,
+        value_column,
+        load_region_table(region_type),
+        region_code_column(region_type),
+        how=aggregation,
+        tree=load_region_index(region_type)
+    )
+
+# Function to load sample datasets
+@st.cache_data
+def load_sample_data(dataset_name):
+    if dataset_name == "World Population":
+        # Sample world population data
+        data = pd.DataFrame({
+            'country_code': ['USA', 'CAN', 'MEX', 'BRA', 'ARG', 'GBR', 'FRA', 'DEU', 'ITA', 'ESP', 
+                            'RUS', 'CHN', 'IND', 'JPN', 'AUS', 'ZAF', 'EGY', 'NGA', 'KEN', 'SAU'],
+            'country_name': ['United States', 'Canada', 'Mexico', 'Brazil', 'Argentina', 'United Kingdom', 
+                            'France', 'Germany', 'Italy', 'Spain', 'Russia', 'China', 'India', 'Japan', 
+                            'Australia', 'South Africa', 'Egypt', 'Nigeria', 'Kenya', 'Saudi Arabia'],
+            'population_millions': [331.0, 38.0, 126.0, 213.0, 45.0, 67.0, 65.0, 83.0, 60.0, 47.0, 
+                                   144.0, 1402.0, 1380.0, 126.0, 25.0, 59.0, 102.0, 206.0, 54.0, 35.0],
+            'gdp_per_capita': [63544, 46195, 9946, 8717, 9912, 41059, 39257, 45724, 31676, 27057, 
+                              10126, 10500, 1901, 40146, 51693, 6001, 3547, 2097, 1816, 20110],
+            'latitude': [37.0902, 56.1304, 23.6345, -14.2350, -38.4161, 55.3781, 46.2276, 51.1657, 
+                        41.8719, 40.4637, 61.5240, 35.8617, 20.5937, 36.2048, -25.2744, -30.5595, 
+                        26.8206, 9.0820, -1.2921, 23.8859],
+            'longitude': [-95.7129, -106.3468, -102.5528, -51.9253, -63.6167, -3.4360, 2.2137, 
+                         10.4515, 12.5674, -3.7492, 105.3188, 104.1954, 78.9629, 138.2529, 133.7751, 
+                         22.9375, 30.8025, 8.6753, 36.8219, 45.0792]
+        })
+        return data
+    elif dataset_name == "US States Data":
+        # Sample US states data
+        data = pd.DataFrame({
+            'state_code': ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA', 
+                          'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD',
+                          'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ',
+                          'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC',
+                          'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY'],
+            'state_name': ['Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California', 'Colorado', 
+                         'Connecticut', 'Delaware', 'Florida', 'Georgia', 'Hawaii', 'Idaho', 
+                         'Illinois', 'Indiana', 'Iowa', 'Kansas', 'Kentucky', 'Louisiana', 
+                         'Maine', 'Maryland', 'Massachusetts', 'Michigan', 'Minnesota', 
+                         'Mississippi', 'Missouri', 'Montana', 'Nebraska', 'Nevada', 
+                         'New Hampshire', 'New Jersey', 'New Mexico', 'New York', 'North Carolina', 
+                         'North Dakota', 'Ohio', 'Oklahoma', 'Oregon', 'Pennsylvania', 
+                         'Rhode Island', 'South Carolina', 'South Dakota', 'Tennessee', 
+                         'Texas', 'Utah', 'Vermont', 'Virginia', 'Washington', 'West Virginia', 
+                         'Wisconsin', 'Wyoming'],
+            'population': [5024279, 733391, 7151502, 3011524, 39538223, 5773714, 3605944, 989948, 
+                         21538187, 10711908, 1455271, 1839106, 12812508, 6785528, 3190369, 2937880, 
+                         4505836, 4657757, 1362359, 6177224, 7029917, 10077331, 5706494, 2961279, 
+                         6154913, 1084225, 1961504, 3104614, 1377529, 9288994, 2117522, 20201249, 
+                         10439388, 779094, 11799448, 3959353, 4237256, 13002700, 1097379, 5118425, 
+                         886667, 6910840, 29145505, 3271616, 643077, 8631393, 7693612, 1793716, 
+                         5893718, 576851],
+            'median_income': [50536, 75463, 58945, 47062, 75235, 72331, 76348, 64805, 55462, 58756, 
+                             80212, 55785, 65886, 56303, 59955, 57422, 50247, 49973, 57918, 84805, 
+                             81215, 57144, 71306, 45792, 55461, 57153, 61439, 58646, 76768, 82545, 
+                             49754, 72108, 54602, 64577, 56111, 52919, 63426, 61744, 67167, 53199, 
+                             58275, 53320, 61874, 71621, 63001, 74222, 74073, 46711, 61747, 64049]
+        })
+        return data
+    else:
+        return None
+
+# Function to process uploaded data; errors are shown in the app, or raised for headless callers
+def process_uploaded_data(uploaded_file, streaming=False, usecols=None, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB,
+                          summaries=None, bbox=None, layer=None, group_by=None, aggregate_column=None,
+                          aggregation='sum', raise_errors=False):
+    try:
+        # Determine file type and read accordingly
+        file_extension = os.path.splitext(uploaded_file.name)[1].lower()
+        
+        if group_by is not None:
+            # Out-of-core: the rows are aggregated while they stream by and only one row per key is kept
+            if file_extension not in ROLLUP_EXTENSIONS:
+                raise ValueError(f"Aggregating while reading needs a CSV or Parquet file, not {file_extension}")
+            progress_bar = st.progress(0.0, text="Aggregating data...")
+            data, rows, unkeyed = rollup_file(
+                uploaded_file,
+                file_extension,
+                group_by,
+                aggregate_column,
+                how=aggregation,
+                progress=lambda fraction: progress_bar.progress(fraction, text="Aggregating data...")
+            )
+            progress_bar.empty()
+            st.info(f"Aggregated {rows:,} rows into {len(data):,} {group_by} values"
+                    + (f"; {unkeyed:,} rows had no {group_by}." if unkeyed else "."))
+        elif streaming and file_extension in STREAMING_EXTENSIONS:
+            # Read in chunks, keeping only the selected columns in compact dtypes
+            progress_bar = st.progress(0.0, text="Reading data...")
+            data = read_tabular_chunked(
+                uploaded_file,
+                file_extension,
+                usecols=usecols,
+                memory_budget_mb=memory_budget_mb,
+                progress=lambda fraction: progress_bar.progress(fraction, text="Reading data..."),
+                # Column statistics are accumulated from the same chunks, without a second pass
+                on_chunk=None if summaries is None else lambda chunk: update_summaries(summaries, chunk)
+            )
+            progress_bar.empty()
+        elif file_extension == '.csv':
+            data = pd.read_csv(uploaded_file, usecols=usecols)
+        elif file_extension in ['.xls', '.xlsx']:
+            data = pd.read_excel(uploaded_file, usecols=usecols)
+        elif file_extension == '.json':
+            data = pd.read_json(uploaded_file)
+        elif file_extension == '.jsonl':
+            data = pd.read_json(uploaded_file, lines=True)
+        elif file_extension in VECTOR_EXTENSIONS or file_extension in PARQUET_EXTENSIONS:
+            # Columns, bounding box and layer are pushed down, so nothing else is decoded
+            data = read_vector(uploaded_file, file_extension, columns=usecols, bbox=bbox, layer=layer)
+        else:
+            raise ValueError(f"Unsupported file format: {file_extension}")
+        
+        # Formats that cannot be chunked are still pruned and downcast in streaming mode
+        if (streaming and group_by is None and file_extension not in STREAMING_EXTENSIONS
+                and not isinstance(data, gpd.GeoDataFrame)):
+            data = compact_frame(data, usecols=usecols, memory_budget_mb=memory_budget_mb)
+            
+        return data
+    except MemoryBudgetExceeded as e:
+        if raise_errors:
+            raise
+        st.error(f"Upload too large: {str(e)}")
+        return None
+    except Exception as e:
+        if raise_errors:
+            raise
+        st.error(f"Error processing file: {str(e)}")
+        return None
+
+# Function to bin point data; cached per data fingerprint, grid and resolution so reruns reuse the bins
+@st.cache_data(max_entries=16, show_spinner="Binning points...")
+def load_point_bins(_data, data_fingerprint, lat_column, lon_column, value_column, grid, cell_size):
+    return bin_points(
+        _data[lat_column].to_numpy(dtype='float64', na_value=np.nan),
+        _data[lon_column].to_numpy(dtype='float64', na_value=np.nan),
+        _data[value_column].to_numpy(dtype='float64', na_value=np.nan),
+        cell_size=cell_size,
+        grid=grid
+    )
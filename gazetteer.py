@@ -0,0 +1,217 @@
+"""Offline gazetteer that matches region names and codes to boundary keys.
+
+The index is built from a boundary set's own attributes: every column that
+identifies its regions (names, ISO-2, ISO-3 and numeric codes) contributes
+its values, plus a table of common aliases such as "USA", "Ivory Coast" or
+state abbreviations. Values are normalized (case, accents, punctuation,
+leading zeros of numeric codes) before the exact lookup. Names that still do
+not match are compared by character trigrams to find candidate spellings; a
+candidate is only taken when it is a few edits away and clearly closer than
+any other region's name, and such approximate matches are reported apart
+from exact ones so a wrong join does not hide in the match rate.
+
+Matching a column factorizes it first, so each distinct value is resolved
+once no matter how many rows repeat it, and resolved values are remembered
+for the next column that contains them.
+"""
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Trigram similarity (Jaccard) a name needs to be considered as a spelling variant
+TRIGRAM_MIN_SIMILARITY = 0.5
+
+# A spelling variant may differ from its name by at most this share of the name's characters
+# (at least one edit), and must be fewer edits away than any other region's name
+FUZZY_MAX_EDIT_RATIO = 0.25
+
+# Values shorter than this are codes and are only matched exactly
+TRIGRAM_MIN_LENGTH = 4
+
+# A column identifies regions when at least this share of its values is distinct
+IDENTIFIER_MIN_DISTINCT = 0.9
+
+# Natural Earth and others use these for "no code"
+PLACEHOLDER_VALUES = {"", "-99", "-1", "nan", "none", "null"}
+
+# Distinct values remembered per gazetteer before the memo starts over
+RESOLVED_CACHE_ENTRIES = 200_000
+
+# Common names a boundary file does not carry, with a name or code it does
+ALIASES = {
+    "usa": "USA", "us": "USA", "america": "USA", "united states of america": "USA",
+    "uk": "GBR", "great britain": "GBR", "britain": "GBR", "england": "GBR",
+    "russia": "RUS", "russian federation": "RUS",
+    "south korea": "KOR", "korea": "KOR", "republic of korea": "KOR",
+    "north korea": "PRK", "dprk": "PRK",
+    "ivory coast": "CIV", "cote divoire": "CIV",
+    "czech republic": "CZE", "czechia": "CZE",
+    "drc": "COD", "dr congo": "COD", "congo kinshasa": "COD", "democratic republic of congo": "COD",
+    "congo brazzaville": "COG", "republic of congo": "COG",
+    "burma": "MMR", "myanmar": "MMR",
+    "swaziland": "SWZ", "eswatini": "SWZ",
+    "macedonia": "MKD", "north macedonia": "MKD",
+    "cape verde": "CPV", "cabo verde": "CPV",
+    "east timor": "TLS", "timor leste": "TLS",
+    "holland": "NLD", "netherlands": "NLD",
+    "turkiye": "TUR", "turkey": "TUR",
+    "laos": "LAO", "syria": "SYR", "iran": "IRN", "vietnam": "VNM", "viet nam": "VNM",
+    "bolivia": "BOL", "venezuela": "VEN", "tanzania": "TZA", "moldova": "MDA",
+    "palestine": "PSE", "taiwan": "TWN", "brunei": "BRN", "uae": "ARE",
+    "bosnia": "BIH", "bosnia herzegovina": "BIH", "vatican": "VAT", "falklands": "FLK",
+    "gambia": "GMB", "bahamas": "BHS", "sao tome": "STP", "guinea bissau": "GNB",
+    # US states by postal abbreviation, for boundary files that only carry names
+    "al": "Alabama", "ak": "Alaska", "az": "Arizona", "ar": "Arkansas", "ca": "California",
+    "co": "Colorado", "ct": "Connecticut", "de": "Delaware", "dc": "District of Columbia",
+    "fl": "Florida", "ga": "Georgia", "hi": "Hawaii", "id": "Idaho", "il": "Illinois",
+    "in": "Indiana", "ia": "Iowa", "ks": "Kansas", "ky": "Kentucky", "la": "Louisiana",
+    "me": "Maine", "md": "Maryland", "ma": "Massachusetts", "mi": "Michigan", "mn": "Minnesota",
+    "ms": "Mississippi", "mo": "Missouri", "mt": "Montana", "ne": "Nebraska", "nv": "Nevada",
+    "nh": "New Hampshire", "nj": "New Jersey", "nm": "New Mexico", "ny": "New York",
+    "nc": "North Carolina", "nd": "North Dakota", "oh": "Ohio", "ok": "Oklahoma", "or": "Oregon",
+    "pa": "Pennsylvania", "ri": "Rhode Island", "sc": "South Carolina", "sd": "South Dakota",
+    "tn": "Tennessee", "tx": "Texas", "ut": "Utah", "vt": "Vermont", "va": "Virginia",
+    "wa": "Washington", "wv": "West Virginia", "wi": "Wisconsin", "wy": "Wyoming",
+    "pr": "Puerto Rico", "washington dc": "District of Columbia",
+}
+
+# Per-row boundary keys (None where unmatched), how many rows with a value matched, and
+# (value, key) pairs of values matched by approximate spelling
+RegionMatches = namedtuple("RegionMatches", ["keys", "matched", "total", "unmatched_values", "fuzzy_values"])
+
+
+# Function to normalize names and codes: case, accents, punctuation and leading zeros
+def normalize_names(values):
+    names = (pd.Series(values, dtype="object").astype("string")
+             .str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+             .str.lower()
+             # Codes read as floats ("242.0") are the same code as "242"
+             .str.replace(r"^(\d+)\.0+$", r"\1", regex=True)
+             .str.replace("&", " and ", regex=False)
+             .str.replace(r"['’`.]", "", regex=True)
+             .str.replace(r"[^a-z0-9]+", " ", regex=True)
+             .str.strip()
+             .str.replace(r"^the ", "", regex=True))
+    # Numeric codes match with or without zero padding ("004" and "4")
+    return names.str.replace(r"^0+(?=\d)", "", regex=True)
+
+
+# Function to count the single-character edits between two names
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+# Function to split a normalized name into its padded character trigrams
+def trigrams(name):
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Gazetteer:
+    """Lookup from normalized region names and codes to one key column of a boundary attribute table."""
+
+    def __init__(self, regions, key_column):
+        self.key_column = key_column
+        self.keys = regions[key_column].to_numpy(dtype="object")
+        self._index = {}
+        self._resolved = {}
+        self._lock = threading.Lock()
+
+        # The key column comes first, so its values win over the same text in other columns
+        columns = [key_column] + [col for col in regions.columns if col != key_column]
+        for column in columns:
+            values = regions[column]
+            if values.nunique() < IDENTIFIER_MIN_DISTINCT * max(values.notna().sum(), 1):
+                continue
+            for row, token in enumerate(normalize_names(values).to_numpy(dtype="object", na_value=None)):
+                if token is not None and token not in PLACEHOLDER_VALUES:
+                    self._index.setdefault(token, row)
+
+        for alias, canonical in zip(ALIASES, normalize_names(list(ALIASES.values()))):
+            row = self._index.get(canonical)
+            if row is not None:
+                self._index.setdefault(alias, row)
+
+        # Inverted trigram index over the names, for spelling variants
+        self._names = [token for token in self._index if len(token) >= TRIGRAM_MIN_LENGTH]
+        self._name_sizes = np.array([len(trigrams(name)) for name in self._names])
+        postings = {}
+        for position, name in enumerate(self._names):
+            for gram in trigrams(name):
+                postings.setdefault(gram, []).append(position)
+        self._postings = {gram: np.array(positions) for gram, positions in postings.items()}
+
+    def __len__(self):
+        return len(self._index)
+
+    def _closest_name(self, token):
+        grams = [gram for gram in trigrams(token) if gram in self._postings]
+        if not grams or len(token) < TRIGRAM_MIN_LENGTH:
+            return -1
+        shared = np.bincount(np.concatenate([self._postings[gram] for gram in grams]),
+                             minlength=len(self._names))
+        similarity = shared / (len(trigrams(token)) + self._name_sizes - shared)
+
+        # Trigrams only propose candidates: a truncated or longer name ("Dominica" and
+        # "Dominican Rep.") shares as many trigrams as a typo does, but is many edits away
+        edits = {}
+        for position in np.flatnonzero(similarity >= TRIGRAM_MIN_SIMILARITY):
+            name = self._names[position]
+            distance = edit_distance(token, name)
+            if distance <= max(1, FUZZY_MAX_EDIT_RATIO * len(name)):
+                row = self._index[name]
+                edits[row] = min(distance, edits.get(row, distance))
+        if not edits:
+            return -1
+        ranked = sorted(edits.items(), key=lambda item: item[1])
+        # Two regions equally close is a guess, not a match
+        if len(ranked) > 1 and ranked[1][1] == ranked[0][1]:
+            return -1
+        return ranked[0][0]
+
+    def _resolve(self, values):
+        # Rows into the boundary keys for distinct values (-1 where nothing matches), and
+        # which of them were matched by approximate spelling
+        tokens = normalize_names(values).to_numpy(dtype="object", na_value=None)
+        rows = np.full(len(tokens), -1, dtype="int64")
+        fuzzy = np.zeros(len(tokens), dtype=bool)
+        for i, token in enumerate(tokens):
+            if token is None:
+                continue
+            row = self._index.get(token)
+            if row is None:
+                row = self._closest_name(token)
+                fuzzy[i] = row >= 0
+            rows[i] = row
+        return rows, fuzzy
+
+    def match(self, values):
+        """Translate a column of names or codes into boundary keys, row by row."""
+        codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+        with self._lock:
+            resolved = [self._resolved.get(value, (-2, False)) for value in uniques]
+        known = np.array([row for row, _ in resolved], dtype="int64")
+        fuzzy = np.array([approximate for _, approximate in resolved], dtype=bool)
+        new = known == -2
+        if new.any():
+            known[new], fuzzy[new] = self._resolve(uniques[new])
+            with self._lock:
+                if len(self._resolved) > RESOLVED_CACHE_ENTRIES:
+                    self._resolved.clear()
+                self._resolved.update(zip(uniques[new], zip(known[new].tolist(), fuzzy[new].tolist())))
+
+        rows = np.where(codes >= 0, known[np.maximum(codes, 0)], -1)
+        keys = np.where(rows >= 0, self.keys[np.maximum(rows, 0)], None)
+        located = codes >= 0
+        matched = int((rows >= 0).sum())
+        unmatched = uniques[known < 0]
+        fuzzy_values = [(value, self.keys[row]) for value, row in zip(uniques[fuzzy][:10], known[fuzzy][:10])]
+        return RegionMatches(keys, matched, int(located.sum()), list(unmatched[:10]), fuzzy_values)
@@ -0,0 +1,73 @@
+"""Level-of-detail helpers for boundary geometry.
+
+Boundary sets are simplified at a fixed ladder of tolerances (in degrees) and
+their coordinates are snapped to a grid so the GeoJSON inlined into a map
+stays proportional to what can actually be seen at the map's zoom level.
+Boundary packs hold every level, computed with build_lod_levels when the
+pack is built, so processes that open a pack never simplify it themselves.
+"""
+import shapely
+
+# Tolerances in degrees; 0.0 is the untouched full-resolution geometry
+LOD_TOLERANCES = (0.0, 0.01, 0.05, 0.1, 0.25)
+
+# Grid size used for coordinate quantization, relative to the tolerance
+QUANTIZE_FACTOR = 0.1
+
+# Finest grid ever used, roughly one metre at the equator
+MIN_GRID_SIZE = 1e-5
+
+# Web Mercator tiles are 256px wide and span 360 degrees at zoom 0
+TILE_SIZE = 256
+
+
+# Function to snap coordinates to a grid derived from the tolerance
+def quantize_geometry(geometry, tolerance):
+    grid_size = max(tolerance * QUANTIZE_FACTOR, MIN_GRID_SIZE)
+    snapped = shapely.set_precision(geometry, grid_size)
+    # Tiny islands can collapse to nothing on a coarse grid; keep the originals
+    collapsed = shapely.is_empty(snapped) & ~shapely.is_empty(geometry)
+    snapped[collapsed] = geometry[collapsed]
+    return snapped
+
+
+# Function to simplify a boundary set while keeping shared borders shared
+def simplify_boundaries(geo_data, tolerance):
+    if tolerance <= 0:
+        return geo_data.copy()
+
+    geometry = geo_data.geometry.to_numpy()
+    # Coverage simplification moves shared edges together, so neighbouring
+    # regions never gain gaps or overlaps; it needs shapely >= 2.1 and a
+    # valid polygonal coverage, otherwise fall back to per-feature simplify
+    if hasattr(shapely, 'coverage_simplify') and shapely.coverage_is_valid(geometry):
+        simplified = shapely.coverage_simplify(geometry, tolerance)
+    else:
+        simplified = shapely.simplify(geometry, tolerance, preserve_topology=True)
+
+    result = geo_data.copy()
+    result.geometry = quantize_geometry(simplified, tolerance)
+    return result
+
+
+# Function to precompute every level of detail for a boundary set
+def build_lod_levels(geo_data, tolerances=LOD_TOLERANCES):
+    return {tolerance: simplify_boundaries(geo_data, tolerance) for tolerance in tolerances}
+
+
+# Function to pick the coarsest level that is still finer than one screen pixel
+def pick_lod_tolerance(zoom=None, width_px=None, bounds=None, tolerances=LOD_TOLERANCES):
+    # Pixel size from the zoom level and from the view's width; the finer one wins, since a map
+    # wider than its bounds suggest shows more detail than its zoom alone would
+    estimates = []
+    if zoom is not None:
+        estimates.append(360.0 / (TILE_SIZE * 2 ** zoom))
+    if width_px and bounds is not None:
+        min_x, _, max_x, _ = bounds
+        estimates.append((max_x - min_x) / width_px)
+    if not estimates:
+        return min(tolerances)
+    degrees_per_pixel = min(estimates)
+
+    candidates = [t for t in tolerances if t <= degrees_per_pixel]
+    return max(candidates) if candidates else min(tolerances)
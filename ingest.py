@@ -0,0 +1,153 @@
+"""Chunked, column-pruned ingest for large tabular uploads.
+
+CSV and JSON-lines files are read in chunks; every chunk is pruned to the
+requested columns and downcast (low-cardinality text to categorical, floats to
+float32, integers to the smallest integer type) before the next one is read.
+The running size of the parsed frame is checked against a memory budget so a
+too-large upload fails with a clear error instead of exhausting the server.
+"""
+import os
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from vector_io import PARQUET_EXTENSIONS, VECTOR_EXTENSIONS
+
+DEFAULT_CHUNK_ROWS = 100_000
+
+# Budget for the parsed frame, overridable with GEODATA_MEMORY_BUDGET_MB
+DEFAULT_MEMORY_BUDGET_MB = int(os.environ.get("GEODATA_MEMORY_BUDGET_MB", "1024"))
+
+# Text columns with fewer distinct values than this share of rows become categorical
+CATEGORY_RATIO = 0.5
+
+STREAMING_EXTENSIONS = ('.csv', '.jsonl')
+
+
+class MemoryBudgetExceeded(Exception):
+    pass
+
+
+# Function to list the columns of a tabular upload without parsing its rows
+def peek_columns(uploaded_file, file_extension, layer=None):
+    uploaded_file.seek(0)
+    try:
+        if file_extension == '.csv':
+            return list(pd.read_csv(uploaded_file, nrows=0).columns)
+        if file_extension == '.jsonl':
+            return list(pd.read_json(uploaded_file, lines=True, nrows=1).columns)
+        if file_extension in ('.xls', '.xlsx'):
+            return list(pd.read_excel(uploaded_file, nrows=0).columns)
+        if file_extension in VECTOR_EXTENSIONS or file_extension in PARQUET_EXTENSIONS:
+            from vector_io import peek_vector_columns
+            return peek_vector_columns(uploaded_file, file_extension, layer)
+        # Plain JSON has to be parsed in full before its columns are known
+        return []
+    finally:
+        uploaded_file.seek(0)
+
+
+# Function to decide, from the first chunk, which text columns become categorical
+def choose_category_columns(chunk):
+    columns = []
+    for col in chunk.columns:
+        dtype = chunk[col].dtype
+        if len(chunk) > 0 and (pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)):
+            if chunk[col].nunique(dropna=True) <= CATEGORY_RATIO * len(chunk):
+                columns.append(col)
+    return columns
+
+
+# Function to shrink a chunk to compact dtypes
+def downcast_chunk(chunk, category_columns=()):
+    for col in chunk.columns:
+        series = chunk[col]
+        if col in category_columns:
+            chunk[col] = series.astype('category')
+        elif pd.api.types.is_float_dtype(series):
+            chunk[col] = series.astype('float32')
+        elif pd.api.types.is_integer_dtype(series):
+            chunk[col] = pd.to_numeric(series, downcast='integer')
+    return chunk
+
+
+# Function to concatenate chunks, merging categoricals whose categories differ
+def concat_chunks(chunks, category_columns=()):
+    if not chunks:
+        return pd.DataFrame()
+    for col in category_columns:
+        parts = [chunk[col] for chunk in chunks if col in chunk.columns and chunk[col].dtype == 'category']
+        if not parts:
+            continue
+        # Categories are unioned before concatenating: chunks whose categories differ would
+        # otherwise concatenate to object dtype, with every value a separate Python string
+        categories = union_categoricals(
+            [pd.Categorical([], categories=part.cat.categories) for part in parts], ignore_order=True
+        ).categories
+        for chunk in chunks:
+            if col in chunk.columns and chunk[col].dtype == 'category':
+                chunk[col] = chunk[col].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+
+# Function to stop ingest cleanly once the parsed rows outgrow the budget
+def check_memory_budget(used_bytes, memory_budget_mb, n_rows):
+    if used_bytes > memory_budget_mb * 1024 * 1024:
+        raise MemoryBudgetExceeded(
+            f"Parsed data exceeds the {memory_budget_mb} MB memory budget after "
+            f"{n_rows:,} rows. Load fewer columns or raise the budget."
+        )
+
+
+# Function to prune and downcast a frame that could not be read in chunks
+def compact_frame(data, usecols=None, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    if usecols is not None:
+        data = data[[col for col in usecols if col in data.columns]]
+    data = downcast_chunk(data.copy(), choose_category_columns(data))
+    check_memory_budget(int(data.memory_usage(deep=True).sum()), memory_budget_mb, len(data))
+    return data
+
+
+# Function to read a tabular upload in chunks under a memory budget
+def read_tabular_chunked(uploaded_file, file_extension, usecols=None,
+                         chunk_rows=DEFAULT_CHUNK_ROWS,
+                         memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB,
+                         progress=None, on_chunk=None):
+    if file_extension not in STREAMING_EXTENSIONS:
+        raise ValueError(f"Streaming ingest does not support {file_extension} files")
+
+    uploaded_file.seek(0)
+    total_bytes = getattr(uploaded_file, 'size', None)
+
+    if file_extension == '.csv':
+        reader = pd.read_csv(uploaded_file, usecols=usecols, chunksize=chunk_rows)
+    else:
+        reader = pd.read_json(uploaded_file, lines=True, chunksize=chunk_rows)
+
+    chunks = []
+    category_columns = None
+    used_bytes = 0
+    rows_read = 0
+    for chunk in reader:
+        if usecols is not None:
+            chunk = chunk[[col for col in usecols if col in chunk.columns]].copy()
+        if category_columns is None:
+            category_columns = choose_category_columns(chunk)
+        chunk = downcast_chunk(chunk, category_columns)
+
+        used_bytes += int(chunk.memory_usage(deep=True).sum())
+        rows_read += len(chunk)
+        check_memory_budget(used_bytes, memory_budget_mb, rows_read)
+        chunks.append(chunk)
+        if on_chunk is not None:
+            on_chunk(chunk)
+
+        if progress is not None and total_bytes:
+            progress(min(uploaded_file.tell() / total_bytes, 1.0))
+
+    if progress is not None:
+        progress(1.0)
+    data = concat_chunks(chunks, category_columns or ())
+    # The chunks were within budget; the concatenated frame is checked as well
+    check_memory_budget(int(data.memory_usage(deep=True).sum()), memory_budget_mb, len(data))
+    return data
@@ -0,0 +1,91 @@
+"""Opt-in timing of the stages of one script rerun.
+
+A RerunProfiler collects timed spans (parse, boundary load, folium build,
+HTML render, st_folium transfer, statistics, ...) with attributes such as
+cache hit/miss and payload bytes. When the rerun finishes, the profile is
+appended as one JSON line to the profile log for offline analysis. When
+profiling is off a NullProfiler with the same interface is used, so call
+sites stay unconditional and cost nothing.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+PROFILE_ENABLED = os.environ.get("GEODATA_PROFILE", "").lower() in ("1", "true", "yes")
+PROFILE_LOG = os.environ.get("GEODATA_PROFILE_LOG", os.path.join(tempfile.gettempdir(), "geodata-profile.jsonl"))
+
+_log_lock = threading.Lock()
+
+
+class RerunProfiler:
+    """Timed spans and events of one rerun."""
+
+    enabled = True
+
+    def __init__(self, session_id, rerun, log_path=PROFILE_LOG, started=None):
+        self.session_id = session_id
+        self.rerun = rerun
+        self.log_path = log_path
+        self.spans = []
+        self._depth = 0
+        # `started` is a perf_counter reading taken before the script's imports ran
+        self._start = time.perf_counter() if started is None else started
+        self._started_at = time.time() - (time.perf_counter() - self._start)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        # The yielded dict can be filled in while the span runs, e.g. with a cache outcome
+        record = {"name": name, "depth": self._depth,
+                  "start_ms": round((time.perf_counter() - self._start) * 1000, 2), **attrs}
+        self.spans.append(record)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            self._depth -= 1
+
+    def event(self, name, **attrs):
+        self.spans.append({"name": name, "depth": self._depth,
+                           "start_ms": round((time.perf_counter() - self._start) * 1000, 2),
+                           "duration_ms": 0.0, **attrs})
+
+    def summary(self):
+        return {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self._started_at)),
+            "session": self.session_id,
+            "rerun": self.rerun,
+            "total_ms": round((time.perf_counter() - self._start) * 1000, 2),
+            "spans": self.spans,
+        }
+
+    def finish(self):
+        summary = self.summary()
+        try:
+            line = json.dumps(summary, default=str)
+            with _log_lock, open(self.log_path, "a") as f:
+                f.write(line + "\n")
+        except OSError:
+            # Profiling must never break the app
+            pass
+        return summary
+
+
+class NullProfiler:
+    """Stand-in used when profiling is off."""
+
+    enabled = False
+
+    @contextmanager
+    def span(self, name, **attrs):
+        yield {}
+
+    def event(self, name, **attrs):
+        pass
+
+    def finish(self):
+        return None
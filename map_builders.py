@@ -0,0 +1,407 @@
+"""Folium map builders shared by the Streamlit app and the batch renderer.
+
+Each builder takes already-loaded data and returns a folium Map with the
+static layers the image exporter draws from attached to it. geopandas,
+shapely and the vector tile layer are imported by the builders that use
+them, so this module stays cheap enough to import on the landing page.
+"""
+import folium
+import numpy as np
+import pandas as pd
+import streamlit as st
+from branca.colormap import StepColormap, linear
+from folium.plugins import HeatMap, MarkerCluster
+
+from binning import aggregate_bins, bin_points, cell_polygons
+from classify import class_palette, classify_values, compute_breaks, stepped_colormap
+from map_export import attach_static_layer
+from point_engine import BULK_POINT_THRESHOLD, MISSING_COLOR, add_bulk_points, color_map_indices
+from time_series import TimeSliderLayer, build_region_frames
+
+# Size and initial zoom of the interactive map, used to pick boundary detail
+MAP_WIDTH = 800
+MAP_HEIGHT = 500
+MAP_ZOOM_START = 2
+
+# Number of color classes in a choropleth, and the fill for regions without data
+CHOROPLETH_BINS = 6
+CHOROPLETH_MISSING_COLOR = "black"
+
+# Function to find the boundary property that matches the data's join column
+def resolve_geo_join_column(geo_data, join_column):
+    import geopandas as gpd
+    
+    # The GeoDataFrame's attribute columns are the GeoJSON feature properties; boundary
+    # attribute tables carry no geometry column
+    geometry_column = geo_data.geometry.name if isinstance(geo_data, gpd.GeoDataFrame) else None
+    property_keys = [col for col in geo_data.columns if col != geometry_column]
+    
+    # Find the matching join column in the GeoJSON properties
+    geo_join_column = join_column
+    if join_column not in property_keys:
+        # Try common alternatives
+        alternatives = {
+            'country_code': ['ISO_A3', 'iso_a3', 'id', 'ISO3', 'ADMIN'],
+            'state_code': ['id', 'STATE', 'STUSPS', 'STATEFP', 'name']
+        }
+        
+        for alt_key in alternatives.get(join_column, []):
+            if alt_key in property_keys:
+                geo_join_column = alt_key
+                st.info(f"Using '{geo_join_column}' from GeoJSON instead of '{join_column}'")
+                break
+        else:
+            # Any other column is matched through the gazetteer onto the boundaries' own code column
+            geo_join_column = next((key for key in alternatives if key in property_keys), property_keys[0])
+    return geo_join_column
+
+# Function to replace the join column's names or codes with the boundary keys they match
+def apply_region_matches(data, join_column, matches):
+    return data.assign(**{join_column: matches.keys})
+
+# Function to look up each region's value and classify it into a fill color
+def classify_region_values(data, keys, join_column, value_column, color_scheme='Blues', breaks=None):
+    # One value per region; later rows win, as with folium.Choropleth
+    region_values = data.drop_duplicates(join_column, keep='last').set_index(join_column)[value_column]
+    values = keys.map(region_values).astype('float64')
+    
+    # Classify every region in one pass, against the column's breaks or equal intervals over the regions
+    edges = compute_breaks(values, "equal_interval", CHOROPLETH_BINS) if breaks is None else np.asarray(breaks)
+    palette = class_palette(color_scheme, len(edges) - 1)
+    fill = np.asarray(palette + [CHOROPLETH_MISSING_COLOR])[classify_values(values, edges)]
+    return values, fill, palette, edges
+
+# Function to add a stepped legend matching the choropleth classes
+def add_choropleth_legend(m, values, palette, edges, value_column):
+    if values.notna().any():
+        legend = StepColormap(palette, index=list(edges), vmin=edges[0], vmax=edges[-1], caption=value_column)
+        legend.add_to(m)
+        return legend
+    return None
+
+# Function to add pre-colored regions as one GeoJSON layer
+def add_choropleth_layer(parent, geo_data, geo_join_column, keys, values, fill, value_column):
+    import geopandas as gpd
+    
+    # Only the join key, value and fill color travel to the browser
+    features = gpd.GeoDataFrame(
+        {
+            geo_join_column: keys.to_numpy(),
+            value_column: values.round(6).to_numpy(),
+            'fill': fill
+        },
+        geometry=geo_data.geometry.to_numpy(),
+        crs=geo_data.crs
+    )
+    
+    return folium.GeoJson(
+        features.__geo_interface__,
+        name="choropleth",
+        style_function=lambda feature: {
+            "fillColor": feature["properties"]["fill"],
+            "color": "black",
+            "weight": 1,
+            "opacity": 0.2,
+            "fillOpacity": 0.7
+        },
+        highlight_function=lambda feature: {"weight": 3, "fillOpacity": 0.9},
+        tooltip=folium.features.GeoJsonTooltip(
+            fields=[geo_join_column, value_column],
+            aliases=["Region", value_column],
+            localize=True,
+            sticky=False,
+            labels=True,
+            style="""
+                background-color: #F0EFEF;
+                border: 2px solid black;
+                border-radius: 3px;
+                box-shadow: 3px;
+            """,
+            max_width=800,
+        ),
+    ).add_to(parent)
+
+# Function to create a choropleth map using Folium
+def create_choropleth_map(data, geo_data, join_column, value_column, color_scheme='Blues', breaks=None):
+    # Create a base map
+    m = folium.Map(location=[20, 0], zoom_start=MAP_ZOOM_START, tiles="CartoDB positron")
+    
+    property_keys = [col for col in geo_data.columns if col != geo_data.geometry.name]
+    geo_join_column = resolve_geo_join_column(geo_data, join_column)
+    
+    # Create a single choropleth layer with the data joined and colored on the server
+    try:
+        keys = geo_data[geo_join_column]
+        values, fill, palette, edges = classify_region_values(data, keys, join_column, value_column, color_scheme,
+                                                              breaks)
+        
+        add_choropleth_layer(m, geo_data, geo_join_column, keys, values, fill, value_column)
+        
+        # Add a stepped legend matching the bins
+        legend = add_choropleth_legend(m, values, palette, edges, value_column)
+        attach_static_layer(m, "polygons", geo_data.geometry.to_numpy(), fill, crs=geo_data.crs, legend=legend)
+    except Exception as e:
+        st.error(f"Error in choropleth creation: {str(e)}")
+        # Provide debug info
+        st.write("Data sample:", data.head())
+        if len(property_keys) > 0:
+            st.write("GeoJSON property keys:", property_keys[:5])
+        
+    # Add layer control
+    folium.LayerControl().add_to(m)
+    
+    return m
+
+# Function to create a choropleth animated over periods, with the geometry sent once
+def create_time_series_map(data, geo_data, join_column, period_column, value_column, color_scheme='Blues',
+                           breaks=None):
+    import geopandas as gpd
+    
+    # Create a base map
+    m = folium.Map(location=[20, 0], zoom_start=MAP_ZOOM_START, tiles="CartoDB positron")
+    
+    geo_join_column = resolve_geo_join_column(geo_data, join_column)
+    keys = geo_data[geo_join_column]
+    frames = build_region_frames(data, keys, join_column, period_column, value_column, CHOROPLETH_BINS, breaks)
+    if len(frames.periods) == 0:
+        raise ValueError(f"No rows have a value in '{period_column}'")
+    palette = class_palette(color_scheme, len(frames.edges) - 1)
+    
+    # Features carry only their key and column in the frame arrays; the slider colors them
+    features = gpd.GeoDataFrame(
+        {"key": keys.astype(str).to_numpy(), "i": np.arange(len(keys)).tolist()},
+        geometry=geo_data.geometry.to_numpy(),
+        crs=geo_data.crs
+    )
+    layer = folium.GeoJson(
+        features.__geo_interface__,
+        name=f"{value_column} by {period_column}",
+        style_function=lambda feature: {
+            "fillColor": CHOROPLETH_MISSING_COLOR,
+            "color": "black",
+            "weight": 1,
+            "opacity": 0.2,
+            "fillOpacity": 0.7
+        }
+    ).add_to(m)
+    slider = TimeSliderLayer(layer, frames, palette, CHOROPLETH_MISSING_COLOR)
+    slider.add_to(m)
+    
+    # One legend for every frame, since all periods share the class edges
+    legend = add_choropleth_legend(m, pd.Series(frames.values.ravel()), palette, frames.edges, value_column)
+    fill = np.asarray(slider.palette)[frames.classes[slider.start]]
+    attach_static_layer(m, "polygons", features.geometry.to_numpy(), fill, crs=geo_data.crs, legend=legend)
+    
+    # Add layer control
+    folium.LayerControl().add_to(m)
+    
+    return m
+
+# Function to create a viewport-rendered choropleth: a base map with the legend, and a layer of the regions in view
+def create_viewport_choropleth(data, geo_data, rows, join_column, value_column, color_scheme='Blues', tolerance=0.0,
+                               breaks=None, view=None):
+    # The base map only holds the legend, so it is identical on every rerun and stays mounted
+    m = folium.Map(location=[20, 0], zoom_start=MAP_ZOOM_START, tiles="CartoDB positron")
+    
+    geo_join_column = resolve_geo_join_column(geo_data, join_column)
+    keys = geo_data[geo_join_column]
+    # Classes come from every region, so colors stay put while the view moves
+    values, fill, palette, edges = classify_region_values(data, keys, join_column, value_column, color_scheme,
+                                                          breaks)
+    legend = add_choropleth_legend(m, values, palette, edges, value_column)
+    
+    # The regions in view may be loaded on their own, so geo_data only needs their keys
+    if view is None:
+        view = geo_data.iloc[rows]
+    if tolerance > 0:
+        from geometry_lod import simplify_boundaries
+        view = simplify_boundaries(view, tolerance)
+    layer = folium.FeatureGroup(name="regions in view")
+    add_choropleth_layer(layer, view, geo_join_column, keys.iloc[rows], values.iloc[rows], fill[rows], value_column)
+    attach_static_layer(m, "polygons", view.geometry.to_numpy(), fill[rows], crs=view.crs, legend=legend)
+    
+    return m, layer
+
+# Function to create a choropleth map whose boundaries are served as vector tiles
+def create_vector_tile_map(data, tileset, tile_url, join_column, value_column, color_scheme='Blues', breaks=None,
+                           asset_url=None):
+    from vector_tiles import ChoroplethTileLayer, localize_assets
+    
+    # Create a base map; offline there is no basemap service to draw from
+    m = folium.Map(location=[20, 0], zoom_start=MAP_ZOOM_START, tiles=None if asset_url else "CartoDB positron")
+    
+    # Only the per-region colors and values are inlined; geometry comes from the tiles
+    keys = pd.Series(tileset.keys)
+    values, fill, palette, edges = classify_region_values(data, keys, join_column, value_column, color_scheme,
+                                                          breaks)
+    ChoroplethTileLayer(
+        tile_url,
+        keys=keys,
+        fills=fill,
+        values=values,
+        name="choropleth",
+        missing_color=CHOROPLETH_MISSING_COLOR
+    ).add_to(m)
+    
+    legend = add_choropleth_legend(m, values, palette, edges, value_column)
+    # Tile set geometry is already in Web Mercator
+    attach_static_layer(m, "polygons", tileset.geometry, fill, crs="EPSG:3857", legend=legend)
+    folium.LayerControl().add_to(m)
+    
+    # Offline, scripts and stylesheets come from the tile server's vendored copies
+    if asset_url is not None:
+        localize_assets(m, asset_url)
+    
+    return m
+
+# Function to create a point map using Folium
+def create_point_map(data, lat_column, lon_column, value_column, color_scheme='Blues', bulk=None, breaks=None):
+    # Create a base map
+    m = folium.Map(location=[data[lat_column].mean(), data[lon_column].mean()], 
+                  zoom_start=3, tiles="CartoDB positron")
+    
+    # Create a stepped color scale over the column's classes
+    values = data[value_column].to_numpy(dtype='float64', na_value=np.nan)
+    color_map = stepped_colormap(compute_breaks(values) if breaks is None else breaks, color_scheme)
+    
+    # Large inputs are packed into a single layer that the browser clusters
+    if bulk is None:
+        bulk = len(data) > BULK_POINT_THRESHOLD
+    
+    if bulk:
+        add_bulk_points(m, data, lat_column, lon_column, value_column, color_map)
+    else:
+        # Add a marker for each data point
+        marker_cluster = MarkerCluster().add_to(m)
+        
+        for idx, row in data.iterrows():
+            color = MISSING_COLOR if pd.isna(row[value_column]) else color_map(row[value_column])
+            folium.CircleMarker(
+                location=[row[lat_column], row[lon_column]],
+                radius=10,
+                popup=f"{row.name}: {row[value_column]}",
+                color=color,
+                fill=True,
+                fill_color=color,
+                fill_opacity=0.7
+            ).add_to(marker_cluster)
+    
+    # Add a color legend
+    color_map.caption = value_column
+    color_map.add_to(m)
+    
+    # Static exports draw the same points from the class palette
+    indices, palette = color_map_indices(color_map, values)
+    attach_static_layer(
+        m,
+        "points",
+        (data[lon_column].to_numpy(dtype='float64', na_value=np.nan),
+         data[lat_column].to_numpy(dtype='float64', na_value=np.nan)),
+        np.asarray(palette)[indices],
+        legend=color_map
+    )
+    
+    return m
+
+# Function to create a viewport-rendered point map: points in view, or cells of them when there are too many
+def create_viewport_point_map(data, rows, lat_column, lon_column, value_column, cell_size=None,
+                              color_scheme='Blues', breaks=None):
+    # The base map only holds the legend, so it is identical on every rerun and stays mounted
+    m = folium.Map(location=[data[lat_column].mean(), data[lon_column].mean()],
+                  zoom_start=3, tiles="CartoDB positron")
+    
+    # The classes span the whole dataset, so colors stay put while the view moves
+    if breaks is None:
+        breaks = compute_breaks(data[value_column].to_numpy(dtype='float64', na_value=np.nan))
+    color_map = stepped_colormap(breaks, color_scheme, caption=value_column)
+    color_map.add_to(m)
+    
+    view = data.iloc[rows]
+    lat = view[lat_column].to_numpy(dtype='float64', na_value=np.nan)
+    lon = view[lon_column].to_numpy(dtype='float64', na_value=np.nan)
+    values = view[value_column].to_numpy(dtype='float64', na_value=np.nan)
+    layer = folium.FeatureGroup(name="points in view")
+    if cell_size is None:
+        add_bulk_points(layer, view, lat_column, lon_column, value_column, color_map)
+        indices, palette = color_map_indices(color_map, values)
+        attach_static_layer(m, "points", (lon, lat), np.asarray(palette)[indices], legend=color_map)
+    else:
+        bins = bin_points(lat, lon, values, cell_size=cell_size, grid='square')
+        rings, colors = add_cell_layer(layer, bins, aggregate_bins(bins, 'mean'), cell_size, 'square', color_map,
+                                       f"mean of {value_column}")
+        import shapely
+        
+        attach_static_layer(m, "polygons", shapely.polygons(rings), colors, legend=color_map)
+    
+    return m, layer
+
+# Function to create an aggregated point map from binned data
+def create_binned_map(bins, value_column, grid='square', cell_size=1.0, aggregation='count', color_scheme='Blues'):
+    # Create a base map
+    m = folium.Map(location=[bins['lat'].mean(), bins['lon'].mean()] if len(bins) else [20, 0],
+                  zoom_start=3, tiles="CartoDB positron")
+    if len(bins) == 0:
+        return m
+    
+    values = aggregate_bins(bins, aggregation)
+    label = value_column if aggregation != 'count' else 'points'
+    caption = f"{aggregation} of {label}"
+    
+    if grid == 'heatmap':
+        # Weight each bin centre by its normalized aggregate
+        max_val = values.max()
+        weights = (values / max_val).fillna(0) if max_val > 0 else values * 0
+        HeatMap(
+            np.column_stack([bins['lat'], bins['lon'], weights]).tolist(),
+            name=caption,
+            radius=15
+        ).add_to(m)
+        heat_map = linear.YlOrRd_09.scale(0, 1)
+        heat_map.caption = caption
+        attach_static_layer(m, "points", (bins['lon'].to_numpy(), bins['lat'].to_numpy()),
+                            [heat_map(weight) for weight in weights], legend=heat_map)
+        return m
+    
+    color_map = getattr(linear, f"{color_scheme}_09").scale(values.min(), values.max())
+    rings, colors = add_cell_layer(m, bins, values, cell_size, grid, color_map, caption)
+    
+    color_map.caption = caption
+    color_map.add_to(m)
+    import shapely
+    
+    attach_static_layer(m, "polygons", shapely.polygons(rings), colors, legend=color_map)
+    
+    return m
+
+# Function to add binned cells, colored by their aggregate, as one GeoJSON layer
+def add_cell_layer(parent, bins, values, cell_size, grid, color_map, caption):
+    rings = cell_polygons(bins['lat'].to_numpy(), bins['lon'].to_numpy(), cell_size, grid)
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [ring]},
+            "properties": {
+                "value": None if pd.isna(value) else round(float(value), 4),
+                "count": int(count),
+                "color": "#999999" if pd.isna(value) else color_map(value)
+            }
+        }
+        for ring, value, count in zip(rings.tolist(), values, bins['count'])
+    ]
+    
+    folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        name=caption,
+        style_function=lambda feature: {
+            "fillColor": feature["properties"]["color"],
+            "color": feature["properties"]["color"],
+            "weight": 0.5,
+            "fillOpacity": 0.7
+        },
+        tooltip=folium.features.GeoJsonTooltip(
+            fields=["value", "count"],
+            aliases=[caption, "Points"],
+            localize=True
+        )
+    ).add_to(parent)
+    return rings, [feature["properties"]["color"] for feature in features]
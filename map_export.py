@@ -0,0 +1,137 @@
+"""Map export: gzip-compressed HTML and static PNG/SVG images.
+
+Exports are written once per render key into an on-disk cache, so exporting
+a map that any session has already exported is just a file read. HTML is
+streamed from the already-rendered page through gzip in blocks, without a
+temporary copy or a base64 data URI. Static images are drawn with matplotlib
+from the geometry and colors the map builders attach to the map, so no
+headless browser is needed and the image matches the interactive map.
+"""
+import gzip
+import io
+import os
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+
+EXPORT_CACHE_DIR = os.environ.get(
+    "GEODATA_EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "geodata-exports")
+)
+EXPORT_CACHE_MAX_MB = int(os.environ.get("GEODATA_EXPORT_CACHE_MB", "512"))
+
+EXPORT_FORMATS = ("html", "png", "svg")
+EXPORT_MIME_TYPES = {"html": "application/gzip", "png": "image/png", "svg": "image/svg+xml"}
+EXPORT_SUFFIXES = {"html": ".html.gz", "png": ".png", "svg": ".svg"}
+
+GZIP_BLOCK_CHARS = 1024 * 1024
+STATIC_FIGSIZE = (10, 6)
+STATIC_DPI = 150
+
+# One drawable layer: polygon geometry in `crs`, or point (x, y) arrays, with one color per feature
+StaticLayer = namedtuple("StaticLayer", ["kind", "geometry", "colors", "crs"])
+
+
+# Function to record a layer on a folium map for the static renderer
+def attach_static_layer(m, kind, geometry, colors, crs="EPSG:4326", legend=None):
+    if kind not in ("polygons", "points"):
+        raise ValueError(f"Unknown static layer kind: {kind}")
+    m.static_layers = getattr(m, "static_layers", []) + [StaticLayer(kind, geometry, np.asarray(colors), crs)]
+    if legend is not None:
+        m.static_legend = legend
+    return m
+
+
+# Function to return the cache file for a render key and format
+def export_path(key, file_format, cache_dir=EXPORT_CACHE_DIR):
+    return os.path.join(cache_dir, key + EXPORT_SUFFIXES[file_format])
+
+
+# Function to write rendered HTML through gzip in blocks
+def write_gzip_html(html, path):
+    with gzip.open(path, "wb", compresslevel=6) as f:
+        for start in range(0, len(html), GZIP_BLOCK_CHARS):
+            f.write(html[start:start + GZIP_BLOCK_CHARS].encode("utf-8"))
+
+
+# Function to turn a branca colormap into a matplotlib colormap and norm
+def _legend_mappable(legend):
+    import matplotlib.colors as mcolors
+    from matplotlib.cm import ScalarMappable
+
+    index = np.asarray(legend.index, dtype="float64")
+    colors = [tuple(color) for color in legend.colors]
+    if len(colors) == len(index) - 1:
+        # Stepped: one color per class between consecutive edges
+        cmap = mcolors.ListedColormap(colors)
+        norm = mcolors.BoundaryNorm(index, cmap.N)
+    else:
+        span = index[-1] - index[0] or 1.0
+        positions = np.clip((index - index[0]) / span, 0.0, 1.0)
+        positions[0], positions[-1] = 0.0, 1.0
+        cmap = mcolors.LinearSegmentedColormap.from_list("legend", list(zip(positions, colors)))
+        norm = mcolors.Normalize(index[0], index[-1])
+    return ScalarMappable(norm=norm, cmap=cmap)
+
+
+# Function to draw a map's static layers to PNG or SVG bytes
+def draw_static_map(map_obj, file_format="png", figsize=STATIC_FIGSIZE, dpi=STATIC_DPI):
+    layers = getattr(map_obj, "static_layers", None)
+    if not layers:
+        raise ValueError("This map has no static layers to draw")
+    # Only image exports pay for importing matplotlib and geopandas
+    import geopandas as gpd
+    from matplotlib.figure import Figure
+
+    # A bare Figure avoids pyplot's global state, so sessions can export concurrently
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    for layer in layers:
+        if layer.kind == "polygons":
+            gpd.GeoSeries(layer.geometry, crs=layer.crs).plot(
+                ax=ax, color=layer.colors, edgecolor="#333333", linewidth=0.3, alpha=0.85
+            )
+        else:
+            x, y = layer.geometry
+            ax.scatter(x, y, c=layer.colors, s=4 if len(x) > 10000 else 12, linewidths=0, alpha=0.8)
+            if len(y):
+                ax.set_aspect(1 / max(np.cos(np.radians(np.nanmean(y))), 0.1))
+    ax.set_axis_off()
+
+    legend = getattr(map_obj, "static_legend", None)
+    if legend is not None:
+        fig.colorbar(_legend_mappable(legend), ax=ax, shrink=0.6, label=legend.caption or None)
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=file_format, dpi=dpi, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+# Function to return the path of a map's export, creating and caching it on a miss
+def export_map(rendered, file_format, cache_dir=EXPORT_CACHE_DIR, max_mb=EXPORT_CACHE_MAX_MB):
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {file_format}")
+    path = export_path(rendered.key, file_format, cache_dir)
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    os.close(fd)
+    try:
+        if file_format == "html":
+            write_gzip_html(rendered.html, tmp_path)
+        else:
+            with open(tmp_path, "wb") as f:
+                f.write(draw_static_map(rendered.map_obj, file_format))
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    from parse_cache import evict_cache_dir
+
+    evict_cache_dir(cache_dir, max_mb, EXPORT_SUFFIXES.values())
+    return path
@@ -0,0 +1,123 @@
+"""On-disk cache of parsed uploads, shared by every session on the server.
+
+Entries are keyed by a hash of the uploaded bytes plus the parse options and
+stored as Feather files, so re-selecting a file any session has already
+parsed skips the parser entirely. File modification times double as LRU
+recency and the oldest entries are evicted once the cache outgrows its cap.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+import geopandas as gpd
+import pandas as pd
+
+PARSE_CACHE_DIR = os.environ.get(
+    "GEODATA_PARSE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "geodata-parse-cache")
+)
+PARSE_CACHE_MAX_MB = int(os.environ.get("GEODATA_PARSE_CACHE_MB", "2048"))
+
+HASH_BLOCK_BYTES = 8 * 1024 * 1024
+
+# Suffixes tell plain frames and GeoDataFrames apart when reading back
+FRAME_SUFFIX = ".feather"
+GEO_FRAME_SUFFIX = ".geo.feather"
+
+# Upload digests by Streamlit file id, so reruns do not rehash the same bytes
+_digest_memo = {}
+_DIGEST_MEMO_SIZE = 64
+
+
+# Function to hash the bytes of an uploaded file
+def _upload_digest(uploaded_file):
+    memo_key = (getattr(uploaded_file, 'file_id', None), getattr(uploaded_file, 'size', None))
+    if memo_key[0] is not None and memo_key in _digest_memo:
+        return _digest_memo[memo_key]
+
+    digest = hashlib.blake2b(digest_size=20)
+    with uploaded_file.getbuffer() as buffer:
+        for start in range(0, len(buffer), HASH_BLOCK_BYTES):
+            digest.update(buffer[start:start + HASH_BLOCK_BYTES])
+    result = digest.hexdigest()
+
+    if memo_key[0] is not None:
+        if len(_digest_memo) >= _DIGEST_MEMO_SIZE:
+            _digest_memo.pop(next(iter(_digest_memo)))
+        _digest_memo[memo_key] = result
+    return result
+
+
+# Function to build the cache key from the upload's content and parse options
+def parse_cache_key(uploaded_file, options):
+    extension = os.path.splitext(uploaded_file.name)[1].lower()
+    encoded_options = json.dumps(options, sort_keys=True, default=str)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(_upload_digest(uploaded_file).encode())
+    digest.update(extension.encode())
+    digest.update(encoded_options.encode())
+    return digest.hexdigest()
+
+
+def _entry_paths(key, cache_dir):
+    return os.path.join(cache_dir, key + FRAME_SUFFIX), os.path.join(cache_dir, key + GEO_FRAME_SUFFIX)
+
+
+# Function to read a parsed frame back from the cache, or None on a miss
+def load_cached_frame(key, cache_dir=PARSE_CACHE_DIR):
+    frame_path, geo_frame_path = _entry_paths(key, cache_dir)
+    try:
+        if os.path.exists(geo_frame_path):
+            os.utime(geo_frame_path)
+            return gpd.read_feather(geo_frame_path)
+        if os.path.exists(frame_path):
+            os.utime(frame_path)
+            return pd.read_feather(frame_path)
+    except (OSError, ValueError):
+        # A truncated or concurrently evicted entry is just a miss
+        return None
+    return None
+
+
+# Function to write a parsed frame to the cache and enforce the size cap
+def store_cached_frame(key, data, cache_dir=PARSE_CACHE_DIR, max_mb=PARSE_CACHE_MAX_MB):
+    os.makedirs(cache_dir, exist_ok=True)
+    frame_path, geo_frame_path = _entry_paths(key, cache_dir)
+    path = geo_frame_path if isinstance(data, gpd.GeoDataFrame) else frame_path
+
+    # Feather needs a default index and string column names
+    data = data.reset_index(drop=True)
+    data.columns = [str(col) for col in data.columns]
+
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    os.close(fd)
+    try:
+        data.to_feather(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    evict_cache_dir(cache_dir, max_mb)
+    return path
+
+
+# Function to delete the least recently used files with the given suffixes until a cache directory fits its cap
+def evict_cache_dir(cache_dir, max_mb, suffixes=(FRAME_SUFFIX,)):
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and entry.name.endswith(tuple(suffixes)):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    max_bytes = max_mb * 1024 * 1024
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
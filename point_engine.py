@@ -0,0 +1,156 @@
+"""Bulk point layer for large point maps.
+
+Instead of one folium.CircleMarker per row, colors are computed for all rows
+in a single NumPy pass and the coordinates, values and palette indices are
+shipped to the browser as packed base64 typed arrays. The browser builds the
+markers itself and hands them to Leaflet.markercluster in one bulk call.
+"""
+import base64
+
+import numpy as np
+import pandas as pd
+from branca.colormap import StepColormap
+from folium.plugins import MarkerCluster
+from jinja2 import Template
+
+from classify import classify_values
+
+# Row count above which create_point_map switches to the bulk layer
+BULK_POINT_THRESHOLD = 5000
+
+# Number of discrete colors sampled from the color scale
+PALETTE_STEPS = 255
+
+# Color used for rows without a value
+MISSING_COLOR = '#999999'
+
+
+# Function to pack a NumPy array as little-endian base64 for the browser
+def pack_array(values, dtype):
+    return base64.b64encode(np.ascontiguousarray(values, dtype=dtype).tobytes()).decode('ascii')
+
+
+# Function to map every value to a palette index in one vectorized pass
+def compute_color_indices(values, vmin, vmax, steps=PALETTE_STEPS):
+    values = np.asarray(values, dtype='float64')
+    span = vmax - vmin
+    if not np.isfinite(span) or span <= 0:
+        scaled = np.zeros(len(values))
+    else:
+        scaled = (values - vmin) / span
+    indices = np.rint(np.clip(scaled, 0.0, 1.0) * (steps - 1))
+    # The slot after the palette is reserved for missing values
+    indices[~np.isfinite(values)] = steps
+    return indices.astype('uint8')
+
+
+# Function to sample a branca colormap into a fixed palette
+def build_palette(color_map, steps=PALETTE_STEPS):
+    samples = np.linspace(color_map.vmin, color_map.vmax, steps)
+    return [color_map(value) for value in samples] + [MISSING_COLOR]
+
+
+# Function to map values to palette indices for a linear or stepped colormap, with the palette itself
+def color_map_indices(color_map, values):
+    if isinstance(color_map, StepColormap):
+        # A stepped colormap's classes are its palette, so values keep their exact class
+        edges = np.asarray(color_map.index, dtype='float64')
+        palette = [color_map.rgb_hex_str(value) for value in (edges[:-1] + edges[1:]) / 2]
+        return classify_values(values, edges), palette + [MISSING_COLOR]
+    return compute_color_indices(values, color_map.vmin, color_map.vmax), build_palette(color_map)
+
+
+class BulkPointCluster(MarkerCluster):
+    """Clustered circle markers decoded and built client-side from packed arrays."""
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                function decode(b64, ArrayType) {
+                    var bin = atob(b64);
+                    var bytes = new Uint8Array(bin.length);
+                    for (var i = 0; i < bin.length; i++) {
+                        bytes[i] = bin.charCodeAt(i);
+                    }
+                    return new ArrayType(bytes.buffer);
+                }
+
+                var coords = decode("{{ this.coords }}", Float32Array);
+                var values = decode("{{ this.values }}", Float64Array);
+                var colors = decode("{{ this.colors }}", Uint8Array);
+                var labels = {{ this.labels|tojson }};
+                var palette = {{ this.palette|tojson }};
+                var renderer = L.canvas();
+
+                var cluster = L.markerClusterGroup({{ this.options|tojson }});
+                var markers = new Array(values.length);
+                for (var i = 0; i < values.length; i++) {
+                    var color = palette[colors[i]];
+                    markers[i] = L.circleMarker([coords[2 * i], coords[2 * i + 1]], {
+                        radius: {{ this.radius }},
+                        color: color,
+                        fill: true,
+                        fillColor: color,
+                        fillOpacity: {{ this.fill_opacity }},
+                        renderer: renderer,
+                        pointIndex: i
+                    });
+                }
+                cluster.addLayers(markers);
+
+                // One shared popup instead of a popup object per marker; it opens on the map the
+                // cluster is on at click time, since its parent may be a feature group
+                cluster.on('click', function (e) {
+                    var i = e.layer.options.pointIndex;
+                    var label = labels === null ? i : labels[i];
+                    L.popup()
+                        .setLatLng(e.latlng)
+                        .setContent(label + ': ' + values[i])
+                        .openOn(cluster._map);
+                });
+
+                cluster.addTo({{ this._parent.get_name() }});
+                return cluster;
+            })();
+        {% endmacro %}"""
+    )
+
+    def __init__(self, lat, lon, values, color_indices, palette, labels=None,
+                 radius=10, fill_opacity=0.7, name=None, **kwargs):
+        kwargs.setdefault('chunkedLoading', True)
+        super().__init__(name=name, **kwargs)
+        self._name = 'BulkPointCluster'
+        self.coords = pack_array(np.column_stack([lat, lon]), '<f4')
+        self.values = pack_array(values, '<f8')
+        self.colors = pack_array(color_indices, 'u1')
+        self.labels = labels
+        self.palette = palette
+        self.radius = radius
+        self.fill_opacity = fill_opacity
+
+
+# Function to add every row of a DataFrame to a map as one bulk point layer
+def add_bulk_points(m, data, lat_column, lon_column, value_column, color_map):
+    # Rows without coordinates cannot be placed on the map
+    located = data[[lat_column, lon_column]].notna().all(axis=1).to_numpy()
+    data = data.loc[located]
+
+    values = data[value_column].to_numpy(dtype='float64', na_value=np.nan)
+    color_indices, palette = color_map_indices(color_map, values)
+
+    # A default RangeIndex matches the marker position, so labels need not be sent
+    labels = None
+    if not data.index.equals(pd.RangeIndex(len(data))):
+        labels = data.index.astype(str).tolist()
+
+    layer = BulkPointCluster(
+        lat=data[lat_column].to_numpy(dtype='float64'),
+        lon=data[lon_column].to_numpy(dtype='float64'),
+        values=values,
+        color_indices=color_indices,
+        palette=palette,
+        labels=labels,
+    )
+    layer.add_to(m)
+    return layer
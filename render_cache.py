@@ -0,0 +1,135 @@
+"""Bounded LRU cache of finished maps, keyed on everything that affects them.
+
+A rerun whose render inputs (data fingerprint, region type, columns, color
+scheme, ...) are unchanged gets back the folium Map built earlier together
+with its standalone HTML, instead of building and serializing it again.
+streamlit-folium and the static export both need the Map itself, so an
+entry is charged for its element tree (GeoJSON dicts, arrays, geometries)
+as well as for the HTML.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+RENDER_CACHE_MAX_MB = int(os.environ.get("GEODATA_RENDER_CACHE_MB", "256"))
+
+# Rough cost of one shapely coordinate pair plus its share of the geometry object
+COORDINATE_BYTES = 24
+
+# payload_bytes is the HTML sent to the browser; bytes is what the entry holds in memory
+RenderedMap = namedtuple("RenderedMap", ["key", "map_obj", "html", "payload_bytes", "bytes"])
+
+_SCALARS = (str, bytes, int, float, bool, type(None))
+
+
+# Function to derive a stable render key from the inputs that shape a map
+def render_key(**inputs):
+    encoded = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.blake2b(encoded.encode(), digest_size=16).hexdigest()
+
+
+# Function to estimate the memory a built map holds, walking its elements and their data
+def map_object_bytes(map_obj):
+    from branca.element import Element
+
+    total = 0
+    seen = set()
+    stack = [map_obj.get_root()]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            items = [*obj.keys(), *obj.values()]
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            items = obj
+        elif isinstance(obj, np.ndarray):
+            if obj.dtype != object or obj.size == 0:
+                # getsizeof already counts the buffer of an array that owns it
+                total += 0 if obj.base is None else obj.nbytes
+                continue
+            first = obj.flat[0]
+            if type(first).__module__.startswith("shapely"):
+                import shapely
+                total += int(shapely.get_num_coordinates(obj).sum()) * COORDINATE_BYTES
+                continue
+            items = obj.ravel()
+        elif isinstance(obj, Element):
+            items = [vars(obj)]
+        elif hasattr(obj, "memory_usage") and hasattr(obj, "columns"):
+            total += int(obj.memory_usage(deep=True).sum())
+            continue
+        else:
+            continue
+        for item in items:
+            # Coordinates and properties are counted in place; pushing every number would double the walk
+            if isinstance(item, _SCALARS):
+                total += sys.getsizeof(item)
+            else:
+                stack.append(item)
+    return total
+
+
+# Function to render a map to standalone HTML once, for caching and export
+def render_map(key, map_obj):
+    html = map_obj.get_root().render()
+    payload_bytes = len(html.encode("utf-8"))
+    return RenderedMap(key, map_obj, html, payload_bytes, payload_bytes + map_object_bytes(map_obj))
+
+
+class RenderCache:
+    """Thread-safe LRU of RenderedMap entries bounded by their HTML and map object size."""
+
+    def __init__(self, max_mb=RENDER_CACHE_MAX_MB):
+        self.max_bytes = max_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, entry):
+        with self._lock:
+            previous = self._entries.pop(entry.key, None)
+            if previous is not None:
+                self._bytes -= previous.bytes
+            self._entries[entry.key] = entry
+            self._bytes += entry.bytes
+
+            # Keep the newest entry even if it alone exceeds the budget
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.bytes
+                self.evictions += 1
+        return entry
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,190 @@
+"""Out-of-core group aggregation of tabular files larger than memory.
+
+CSV and Parquet files are streamed in partitions (blocks of CSV text, batches
+of Parquet rows) and only the grouping and value columns are decoded. Each partition is
+reduced by the join column to per-key sufficient statistics (row count,
+value count and value sum) on a pool of worker threads, which run Arrow's
+hash aggregation with the GIL released while the next partition is parsed.
+Partial results are merged as they arrive, so at most a few partitions and
+one row per distinct key are ever held, however large the file is. Count,
+sum and mean are derived from the merged statistics, as in the spatial join.
+"""
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from vector_io import PARQUET_EXTENSIONS
+
+ROLLUP_EXTENSIONS = ('.csv',) + PARQUET_EXTENSIONS
+
+ROLLUP_PARTITION_ROWS = int(os.environ.get("GEODATA_ROLLUP_PARTITION_ROWS", "1000000"))
+ROLLUP_WORKERS = int(os.environ.get("GEODATA_ROLLUP_WORKERS", "0")) or os.cpu_count() or 1
+
+# Bytes of CSV text in one partition
+CSV_BLOCK_BYTES = 16 * 1024 * 1024
+
+# Partial tables collected before they are merged into one
+MERGE_EVERY = 32
+
+# Per-key sufficient statistics every partition is reduced to
+STATISTICS = ("row_count", "value_count", "value_sum")
+
+
+# Function to cut a CSV stream into blocks of whole lines, each led by the header
+def _csv_blocks(stream, block_bytes=CSV_BLOCK_BYTES):
+    header = stream.readline()
+    rest = b""
+    while True:
+        block = stream.read(block_bytes)
+        if not block:
+            break
+        block = rest + block
+        cut = block.rfind(b"\n") + 1
+        rest = block[cut:]
+        if cut:
+            yield header + block[:cut]
+    if rest.strip():
+        yield header + rest
+
+
+# Function to parse one CSV block and reduce it, run on a worker thread
+def _aggregate_csv_block(block, key_column, value_column):
+    import pyarrow.csv as csv
+
+    table = csv.read_csv(
+        pa.py_buffer(block),
+        # The pool already parses one block per core
+        read_options=csv.ReadOptions(use_threads=False),
+        convert_options=csv.ConvertOptions(
+            include_columns=[key_column, value_column],
+            # Fixed types keep every block consistent; codes such as "004" stay text
+            column_types={key_column: pa.string(), value_column: pa.float64()},
+            # Empty keys are missing, as pandas reads them
+            strings_can_be_null=True
+        )
+    )
+    return aggregate_partition(table, key_column, value_column)
+
+
+# Function to stream the grouping and value columns of a Parquet file in batches
+def _parquet_batches(source, key_column, value_column, partition_rows):
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(source)
+    total = parquet.metadata.num_rows
+    done = 0
+    for batch in parquet.iter_batches(batch_size=partition_rows, columns=[key_column, value_column]):
+        done += batch.num_rows
+        yield batch, done / total if total else 1.0
+
+
+# Function to reduce one partition to per-key row counts, value counts and value sums
+def aggregate_partition(partition, key_column, value_column):
+    keys = partition.column(key_column)
+    if pa.types.is_dictionary(keys.type):
+        keys = pc.cast(keys, keys.type.value_type)
+    if pa.types.is_string(keys.type) or pa.types.is_large_string(keys.type):
+        # Blank keys are missing whichever format they come from, as CSV parsing makes empty ones
+        blank = pc.equal(pc.utf8_trim_whitespace(keys), "")
+        keys = pc.if_else(blank, pa.scalar(None, keys.type), keys)
+    table = pa.table({
+        key_column: keys,
+        "value": pc.cast(partition.column(value_column), pa.float64()),
+    })
+    grouped = table.group_by(key_column).aggregate([
+        ("value", "count", pc.CountOptions(mode="all")),
+        ("value", "count"),
+        ("value", "sum"),
+    ])
+    # Keys whose values are all missing sum to null; they still count their rows
+    return pa.table({
+        key_column: grouped[key_column],
+        "row_count": grouped.column(1),
+        "value_count": grouped.column(2),
+        "value_sum": pc.fill_null(grouped.column(3), 0.0),
+    })
+
+
+# Function to merge partial statistics that share keys into one row per key
+def merge_partials(partials, key_column):
+    if len(partials) == 1:
+        return partials[0]
+    grouped = pa.concat_tables(partials).group_by(key_column).aggregate(
+        [(statistic, "sum") for statistic in STATISTICS]
+    )
+    return pa.table({key_column: grouped[key_column],
+                     **{statistic: grouped[f"{statistic}_sum"] for statistic in STATISTICS}})
+
+
+# Function to group-aggregate a CSV or Parquet file by a column without loading it
+def rollup_file(source, file_extension, key_column, value_column, how='sum',
+                partition_rows=ROLLUP_PARTITION_ROWS, workers=ROLLUP_WORKERS, progress=None):
+    if file_extension not in ROLLUP_EXTENSIONS:
+        raise ValueError(f"Out-of-core aggregation does not support {file_extension} files")
+    if how not in ('count', 'sum', 'mean'):
+        raise ValueError(f"Unknown aggregation: {how}")
+    if key_column == value_column:
+        raise ValueError("The value column must differ from the column the rows are grouped by")
+
+    # Paths are opened here so progress can follow the read position, as for uploads
+    opened = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else None
+    stream = opened or source
+    try:
+        total_bytes = stream.seek(0, os.SEEK_END)
+        stream.seek(0)
+        if file_extension == '.csv':
+            # Blocks are parsed on the workers too; fields must not span lines, as pyarrow assumes by default
+            tasks = ((_aggregate_csv_block, block, stream.tell() / total_bytes) for block in _csv_blocks(stream))
+        else:
+            tasks = ((aggregate_partition, batch, fraction)
+                     for batch, fraction in _parquet_batches(stream, key_column, value_column, partition_rows))
+
+        partials = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Reading waits while every worker is busy and one partition is queued, so memory does
+            # not grow with the file
+            pending = deque()
+            for function, partition, fraction in tasks:
+                pending.append(pool.submit(function, partition, key_column, value_column))
+                while len(pending) > workers:
+                    partials.append(pending.popleft().result())
+                if len(partials) >= MERGE_EVERY:
+                    partials = [merge_partials(partials, key_column)]
+                if progress is not None:
+                    progress(min(fraction, 1.0))
+            partials.extend(future.result() for future in pending)
+    finally:
+        if opened is not None:
+            opened.close()
+        else:
+            source.seek(0)
+    if progress is not None:
+        progress(1.0)
+
+    if not partials:
+        return pd.DataFrame({key_column: [], value_column: [], 'row_count': []}), 0, 0
+    per_key = merge_partials(partials, key_column).to_pandas()
+    rows = int(per_key['row_count'].sum())
+
+    # Rows without a key cannot be joined to a region
+    missing = per_key[key_column].isna()
+    unkeyed = int(per_key.loc[missing, 'row_count'].sum())
+    per_key = per_key[~missing]
+
+    if how == 'count':
+        result = per_key['row_count'].astype('float64')
+    elif how == 'sum':
+        result = per_key['value_sum']
+    else:
+        result = per_key['value_sum'] / per_key['value_count'].where(per_key['value_count'] > 0)
+
+    aggregated = pd.DataFrame({
+        key_column: per_key[key_column].to_numpy(),
+        value_column: result.to_numpy(),
+        'row_count': per_key['row_count'].to_numpy(),
+    })
+    return aggregated.sort_values(key_column, ignore_index=True), rows, unkeyed
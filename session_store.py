@@ -0,0 +1,227 @@
+"""Memory-budgeted store for the frames every session works on.
+
+Sessions keep only small references in st.session_state: the content key of
+their data (the parse cache key or sample name) and their region type. The
+frames themselves live here once per content key, so analysts who open the
+same file or sample share one copy, and boundary geometry always comes from
+the shared boundary cache. Resident frames are kept under a global budget:
+when it is exceeded, the least recently used frames are spilled to Feather
+files and read back on their next use. Frames that only idle sessions refer
+to are spilled early, and sessions that have been gone long enough release
+their frames altogether.
+"""
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import geopandas as gpd
+import pandas as pd
+import shapely
+
+from render_cache import COORDINATE_BYTES
+
+SESSION_STATE_MAX_MB = int(os.environ.get("GEODATA_SESSION_STATE_MB", "1024"))
+
+# Frames only used by sessions idle this long are spilled; sessions idle for the expiry are forgotten
+SESSION_IDLE_SECONDS = int(os.environ.get("GEODATA_SESSION_IDLE_SECONDS", "600"))
+SESSION_EXPIRE_SECONDS = int(os.environ.get("GEODATA_SESSION_EXPIRE_SECONDS", "86400"))
+
+SPILL_DIR = os.environ.get(
+    "GEODATA_SPILL_DIR", os.path.join(tempfile.gettempdir(), "geodata-session-spill")
+)
+
+SPILL_INDEX_COLUMN = "__index__"
+
+
+# Function to estimate the memory a frame holds, including its geometries' coordinates
+def frame_bytes(frame):
+    used = int(frame.memory_usage(deep=True).sum())
+    if isinstance(frame, gpd.GeoDataFrame):
+        # pandas only counts the pointers of geometry columns
+        for column in frame.columns[frame.dtypes == 'geometry']:
+            used += int(shapely.get_num_coordinates(frame[column].values).sum()) * COORDINATE_BYTES
+    return used
+
+
+class _Entry:
+    __slots__ = ("frame", "bytes", "spill_path", "last_used", "sessions")
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.bytes = frame_bytes(frame)
+        self.spill_path = None
+        self.last_used = time.monotonic()
+        self.sessions = set()
+
+
+class SessionStore:
+    """Thread-safe store of frames shared by content key, spilled to disk past a global budget."""
+
+    def __init__(self, max_mb=SESSION_STATE_MAX_MB, spill_dir=SPILL_DIR,
+                 idle_seconds=SESSION_IDLE_SECONDS, expire_seconds=SESSION_EXPIRE_SECONDS):
+        self.max_bytes = max_mb * 1024 * 1024
+        self.spill_dir = spill_dir
+        self.idle_seconds = idle_seconds
+        self.expire_seconds = expire_seconds
+        self.spills = 0
+        self.reloads = 0
+        self._entries = OrderedDict()
+        self._slots = {}
+        self._seen = {}
+        self._resident_bytes = 0
+        self._lock = threading.RLock()
+
+    def attach(self, session_id, name, key, load):
+        """Point a session's slot at a frame, loading it only if no session holds that key."""
+        with self._lock:
+            known = key in self._entries
+        # Parsing can take a while, so it runs without holding up other sessions
+        frame = None if known else load()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and frame is None:
+                # A failed load leaves the session without data rather than with its previous frame
+                self.detach(session_id, name)
+                return None
+            if entry is None:
+                entry = _Entry(frame)
+                self._entries[key] = entry
+                self._resident_bytes += entry.bytes
+            slots = self._slots.setdefault(session_id, {})
+            previous = slots.get(name)
+            slots[name] = key
+            entry.sessions.add(session_id)
+            if previous is not None and previous != key:
+                self._release(session_id, previous)
+            return self._use(session_id, key)
+
+    def get(self, session_id, name):
+        """Return the frame in a session's slot, reading it back if it was spilled."""
+        with self._lock:
+            key = self._slots.get(session_id, {}).get(name)
+            if key is None or key not in self._entries:
+                return None
+            return self._use(session_id, key)
+
+    def detach(self, session_id, name):
+        with self._lock:
+            key = self._slots.get(session_id, {}).pop(name, None)
+            if key is not None:
+                self._release(session_id, key)
+
+    def _use(self, session_id, key):
+        now = time.monotonic()
+        self._seen[session_id] = now
+        entry = self._entries[key]
+        entry.last_used = now
+        self._entries.move_to_end(key)
+        if entry.frame is None:
+            entry.frame = self._read_spill(entry.spill_path)
+            self._resident_bytes += entry.bytes
+            self.reloads += 1
+        frame = entry.frame
+        # The frame in use is never spilled, even if it alone exceeds the budget
+        self._enforce_budget(keep=key)
+        return frame
+
+    def _release(self, session_id, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.sessions.discard(session_id)
+        if not entry.sessions:
+            self._drop(key)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        if entry.frame is not None:
+            self._resident_bytes -= entry.bytes
+        if entry.spill_path is not None:
+            try:
+                os.remove(entry.spill_path)
+            except FileNotFoundError:
+                pass
+
+    def _enforce_budget(self, keep=None):
+        for key in list(self._entries):
+            if self._resident_bytes <= self.max_bytes:
+                break
+            if key != keep and self._entries[key].frame is not None:
+                self._spill(key)
+
+    def _spill(self, key):
+        entry = self._entries[key]
+        # Frames are never modified in place, so a file written once stays valid for later spills
+        if entry.spill_path is None:
+            entry.spill_path = self._write_spill(entry.frame)
+        entry.frame = None
+        self._resident_bytes -= entry.bytes
+        self.spills += 1
+
+    def _write_spill(self, frame):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        suffix = ".geo.feather" if isinstance(frame, gpd.GeoDataFrame) else ".feather"
+        fd, path = tempfile.mkstemp(dir=self.spill_dir, prefix="frame-", suffix=suffix)
+        os.close(fd)
+        try:
+            # Feather needs a default index, so the index travels as the first column
+            spilled = frame.reset_index(names=SPILL_INDEX_COLUMN)
+            spilled.columns = [str(col) for col in spilled.columns]
+            spilled.to_feather(path)
+        except Exception:
+            os.remove(path)
+            raise
+        return path
+
+    def _read_spill(self, path):
+        frame = gpd.read_feather(path) if path.endswith(".geo.feather") else pd.read_feather(path)
+        return frame.set_index(SPILL_INDEX_COLUMN).rename_axis(None)
+
+    def sweep(self):
+        """Spill frames used only by idle sessions and release the frames of expired sessions."""
+        with self._lock:
+            now = time.monotonic()
+            for session_id, seen in list(self._seen.items()):
+                if now - seen >= self.expire_seconds:
+                    for key in self._slots.pop(session_id, {}).values():
+                        self._release(session_id, key)
+                    del self._seen[session_id]
+
+            for key, entry in list(self._entries.items()):
+                idle = all(now - self._seen.get(session_id, 0.0) >= self.idle_seconds
+                           for session_id in entry.sessions)
+                if idle and entry.frame is not None:
+                    self._spill(key)
+
+    def usage(self, session_id):
+        """Describe the frames a session refers to and what each costs the server."""
+        with self._lock:
+            rows = []
+            for name, key in self._slots.get(session_id, {}).items():
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                rows.append({
+                    "slot": name,
+                    "bytes": entry.bytes,
+                    "resident": entry.frame is not None,
+                    "shared_with": len(entry.sessions) - 1,
+                    # Shared frames are charged to their sessions in equal parts
+                    "charged_bytes": entry.bytes // len(entry.sessions),
+                })
+            return rows
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._seen),
+                "frames": len(self._entries),
+                "resident_frames": sum(entry.frame is not None for entry in self._entries.values()),
+                "resident_bytes": self._resident_bytes,
+                "spilled_bytes": sum(entry.bytes for entry in self._entries.values() if entry.frame is None),
+                "max_bytes": self.max_bytes,
+                "spills": self.spills,
+                "reloads": self.reloads,
+            }
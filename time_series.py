@@ -0,0 +1,157 @@
+"""Time-series choropleths that ship the boundary geometry once.
+
+A long-format table with one row per region and period is pivoted into a
+periods x regions matrix and classified in one vectorized pass against
+breaks shared by every period, so a color means the same value in every
+frame. The boundaries travel as a single GeoJSON layer whose features only
+carry their region key and column in that matrix. Each frame is a packed
+array of one class byte per region, plus float32 values for the tooltips, so
+the payload grows with regions x periods and never with geometry x periods.
+Moving the time slider only restyles the features already on the map.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from branca.element import MacroElement
+from jinja2 import Template
+
+from classify import classify_values, compute_breaks
+from point_engine import pack_array
+
+# Milliseconds each frame is shown while the animation plays
+FRAME_INTERVAL_MS = 800
+
+# Periods in order, a periods x regions value matrix, its class indices and the shared class edges
+RegionFrames = namedtuple("RegionFrames", ["periods", "values", "classes", "edges"])
+
+
+# Function to pivot a long-format table into one row of region values per period
+def pivot_region_periods(data, keys, join_column, period_column, value_column):
+    period_codes, periods = pd.factorize(data[period_column], sort=True)
+    # Boundaries can repeat a key (multi-part regions); every feature gets its key's column
+    unique_keys = pd.Index(pd.unique(keys))
+    region_codes = unique_keys.get_indexer(data[join_column])
+    values = pd.to_numeric(data[value_column], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+    # Rows with an unknown region or no period have nowhere to go; later rows win, as in classify_region_values
+    placed = (period_codes >= 0) & (region_codes >= 0)
+    matrix = np.full((len(periods), len(unique_keys)), np.nan)
+    matrix[period_codes[placed], region_codes[placed]] = values[placed]
+    return periods, matrix[:, unique_keys.get_indexer(keys)]
+
+
+# Function to classify every region of every period in one pass against shared edges, equal-interval by default
+def classify_frames(matrix, bins, edges=None):
+    if edges is None:
+        edges = compute_breaks(matrix.ravel(), "equal_interval", bins)
+    # The slot after the palette is reserved for missing values
+    return classify_values(matrix, edges), np.asarray(edges)
+
+
+# Function to build the frames of a time-series choropleth over the given boundary keys
+def build_region_frames(data, keys, join_column, period_column, value_column, bins, edges=None):
+    periods, matrix = pivot_region_periods(data, keys, join_column, period_column, value_column)
+    classes, edges = classify_frames(matrix, bins, edges)
+    return RegionFrames(periods, matrix, classes, edges)
+
+
+# Function to label periods for the slider; dates lose their empty time of day
+def format_periods(periods):
+    if isinstance(periods, pd.DatetimeIndex):
+        return [str(period.date()) if period == period.normalize() else str(period) for period in periods]
+    return [str(period) for period in periods]
+
+
+class TimeSliderLayer(MacroElement):
+    """Time slider that restyles a GeoJSON layer from packed per-frame class indices."""
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                function decode(b64, ArrayType) {
+                    var bin = atob(b64);
+                    var bytes = new Uint8Array(bin.length);
+                    for (var i = 0; i < bin.length; i++) {
+                        bytes[i] = bin.charCodeAt(i);
+                    }
+                    return new ArrayType(bytes.buffer);
+                }
+
+                var layer = {{ this.layer.get_name() }};
+                var map = {{ this._parent.get_name() }};
+                var periods = {{ this.periods|tojson }};
+                var regions = {{ this.regions }};
+                var classes = decode("{{ this.classes }}", Uint8Array);
+                var values = decode("{{ this.values }}", Float32Array);
+                var palette = {{ this.palette|tojson }};
+                var current = {{ this.start }};
+
+                var control = L.control({position: 'bottomleft'});
+                control.onAdd = function () {
+                    var div = L.DomUtil.create('div', 'leaflet-bar');
+                    div.style.background = 'white';
+                    div.style.padding = '4px 8px';
+                    div.innerHTML = '<button type="button" style="width: 2em">&#9654;</button> ' +
+                        '<input type="range" min="0" max="' + (periods.length - 1) + '" step="1" ' +
+                        'style="vertical-align: middle; width: 240px"> <b></b>';
+                    L.DomEvent.disableClickPropagation(div);
+                    return div;
+                };
+                control.addTo(map);
+                var container = control.getContainer();
+                var button = container.querySelector('button');
+                var slider = container.querySelector('input');
+                var label = container.querySelector('b');
+
+                // Only the fill changes between frames; the geometry stays where it is
+                function show(frame) {
+                    current = frame;
+                    var offset = frame * regions;
+                    layer.eachLayer(function (feature) {
+                        feature.setStyle({fillColor: palette[classes[offset + feature.feature.properties.i]]});
+                    });
+                    slider.value = frame;
+                    label.innerHTML = periods[frame];
+                }
+
+                layer.eachLayer(function (feature) {
+                    feature.bindTooltip(function () {
+                        var properties = feature.feature.properties;
+                        var offset = current * regions + properties.i;
+                        var value = classes[offset] === palette.length - 1 ? 'no data' : values[offset].toLocaleString();
+                        return properties.key + ' (' + periods[current] + '): ' + value;
+                    }, {sticky: true});
+                });
+
+                slider.addEventListener('input', function () { show(+slider.value); });
+                var timer = null;
+                button.addEventListener('click', function () {
+                    if (timer !== null) {
+                        clearInterval(timer);
+                        timer = null;
+                        button.innerHTML = '&#9654;';
+                        return;
+                    }
+                    button.innerHTML = '&#10074;&#10074;';
+                    timer = setInterval(function () { show((current + 1) % periods.length); }, {{ this.interval_ms }});
+                });
+
+                show(current);
+                return control;
+            })();
+        {% endmacro %}"""
+    )
+
+    def __init__(self, layer, frames, palette, missing_color, start=None, interval_ms=FRAME_INTERVAL_MS):
+        super().__init__()
+        self._name = 'TimeSliderLayer'
+        self.layer = layer
+        self.periods = format_periods(frames.periods)
+        self.regions = frames.classes.shape[1]
+        self.classes = pack_array(frames.classes, 'u1')
+        self.values = pack_array(frames.values, '<f4')
+        self.palette = list(palette) + [missing_color]
+        self.start = len(self.periods) - 1 if start is None else start
+        self.interval_ms = interval_ms
@@ -0,0 +1,182 @@
+"""Arrow-native reading of vector files and Parquet.
+
+Vector formats are read through pyogrio's Arrow stream, so GDAL hands over
+whole columns instead of one feature at a time. The attribute selection,
+bounding box and layer are passed down to GDAL, so features outside the box
+and attributes that were not selected are never decoded. Shapefiles arrive
+as a .zip bundle with their .shx, .dbf and .prj sidecars, GeoPackages and
+bundles can hold several layers. Parquet is read with pyarrow: GeoParquet
+keeps its geometry and uses its bbox covering column to skip features
+outside the box, while plain Parquet loads as a table with only the
+selected columns.
+"""
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from contextlib import contextmanager
+
+import numpy as np
+import pyarrow.parquet as pq
+
+VECTOR_EXTENSIONS = ('.geojson', '.gpkg', '.fgb', '.zip', '.shp')
+PARQUET_EXTENSIONS = ('.parquet', '.geoparquet')
+
+# Free each Arrow column as soon as pandas owns its copy, so the table is never held twice
+ARROW_TO_PANDAS = {"self_destruct": True, "split_blocks": True}
+
+# Datasets looked for inside a .zip bundle
+ZIP_DATASET_SUFFIXES = ('.shp', '.gpkg', '.geojson', '.fgb')
+
+
+# Function to move an uploaded file back to its start; paths need nothing
+def _rewind(source):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+
+# Function to parse "west, south, east, north" into a bounding box, or None when empty
+def parse_bbox(text):
+    if not text or not text.strip():
+        return None
+    try:
+        west, south, east, north = (float(part) for part in text.replace(";", ",").split(","))
+    except ValueError:
+        raise ValueError("Bounding box must be four numbers: west, south, east, north")
+    if west >= east or south >= north:
+        raise ValueError("Bounding box must have west < east and south < north")
+    return (west, south, east, north)
+
+
+# Function to list the datasets inside a .zip bundle
+def zip_members(source):
+    _rewind(source)
+    with zipfile.ZipFile(source) as bundle:
+        members = [name for name in bundle.namelist()
+                   if name.lower().endswith(ZIP_DATASET_SUFFIXES) and not name.startswith('__MACOSX/')]
+    _rewind(source)
+    return members
+
+
+@contextmanager
+def _vector_source(source, file_extension, layer=None):
+    # Yields the path pyogrio should open and the layer to read from it
+    if file_extension == '.shp':
+        raise ValueError("A shapefile needs its .shx, .dbf and .prj files; upload them together as a .zip")
+    if file_extension not in ('.zip', '.gpkg'):
+        _rewind(source)
+        yield source, layer
+        return
+    if not hasattr(source, 'read'):
+        yield _bundle_path(source, file_extension, layer)
+        return
+    # Bundles are opened by path: GDAL only looks into zip subfolders on disk and
+    # recognizes a GeoPackage by its extension
+    with tempfile.NamedTemporaryFile(suffix=file_extension) as bundle:
+        _rewind(source)
+        shutil.copyfileobj(source, bundle)
+        bundle.flush()
+        _rewind(source)
+        yield _bundle_path(bundle.name, file_extension, layer)
+
+
+# Function to resolve a bundle on disk and a layer name to a GDAL path and layer
+def _bundle_path(path, file_extension, layer):
+    import pyogrio
+
+    if file_extension == '.zip':
+        members = zip_members(path)
+        if not members:
+            raise ValueError("The zip file contains no shapefile, GeoPackage, GeoJSON or FlatGeobuf")
+        return f"/vsizip/{os.path.abspath(path)}/{layer if layer in members else members[0]}", None
+    # Without a layer, read the first one rather than let GDAL pick and warn
+    return path, layer if layer is not None else str(pyogrio.list_layers(path)[0][0])
+
+
+# Function to list the layers of a vector file; a zip bundle's layers are its datasets
+def list_vector_layers(source, file_extension):
+    if file_extension == '.zip':
+        return zip_members(source)
+    if file_extension != '.gpkg':
+        return []
+    import pyogrio
+
+    with _vector_source(source, file_extension) as (path, _):
+        layers = [str(name) for name, _ in pyogrio.list_layers(path)]
+    _rewind(source)
+    return layers
+
+
+# Function to read the GeoParquet metadata of a Parquet file, or None for plain Parquet
+def geoparquet_metadata(source):
+    _rewind(source)
+    metadata = pq.read_schema(source).metadata or {}
+    _rewind(source)
+    return json.loads(metadata[b'geo']) if b'geo' in metadata else None
+
+
+# Function to list the attribute columns of a vector or Parquet file without reading its features
+def peek_vector_columns(source, file_extension, layer=None):
+    if file_extension in PARQUET_EXTENSIONS:
+        _rewind(source)
+        names = pq.read_schema(source).names
+        _rewind(source)
+        geo = geoparquet_metadata(source)
+        if geo is None:
+            return names
+        # Geometry is always read and covering columns only serve the bbox filter, so neither is offered
+        hidden = set(geo.get('columns', {}))
+        for column in geo.get('columns', {}).values():
+            hidden.update(path[0] for path in column.get('covering', {}).get('bbox', {}).values())
+        return [name for name in names if name not in hidden]
+
+    import pyogrio
+
+    with _vector_source(source, file_extension, layer) as (path, path_layer):
+        fields = pyogrio.read_info(path, layer=path_layer)['fields']
+    _rewind(source)
+    return [str(field) for field in fields]
+
+
+# Function to read a Parquet file with column and bounding box pushdown
+def read_parquet(source, columns=None, bbox=None):
+    import geopandas as gpd
+    import pandas as pd
+
+    geo = geoparquet_metadata(source)
+    if geo is None:
+        # Plain Parquet has no geometry; a bounding box does not apply
+        return pd.read_parquet(source, columns=columns)
+
+    primary = geo['primary_column']
+    if columns is not None:
+        columns = list(dict.fromkeys([*columns, primary]))
+    try:
+        # Files with a bbox covering column skip row groups and rows outside the box
+        data = gpd.read_parquet(source, columns=columns, bbox=bbox)
+    except ValueError:
+        if bbox is None:
+            raise
+        # Without a covering column the box is applied once the geometry is loaded
+        import shapely
+
+        _rewind(source)
+        data = gpd.read_parquet(source, columns=columns)
+        data = data.iloc[np.sort(data.sindex.query(shapely.box(*bbox), predicate='intersects'))]
+    _rewind(source)
+    return data
+
+
+# Function to read a vector or Parquet file with column, bounding box and layer pushdown
+def read_vector(source, file_extension, columns=None, bbox=None, layer=None):
+    if file_extension in PARQUET_EXTENSIONS:
+        return read_parquet(source, columns=columns, bbox=bbox)
+
+    import pyogrio
+
+    with _vector_source(source, file_extension, layer) as (path, path_layer):
+        data = pyogrio.read_dataframe(path, layer=path_layer, columns=columns, bbox=bbox, use_arrow=True,
+                                      arrow_to_pandas_kwargs=ARROW_TO_PANDAS)
+    _rewind(source)
+    return data
@@ -0,0 +1,405 @@
+"""Local Mapbox Vector Tile serving for large polygon layers.
+
+Boundary geometry is projected to Web Mercator once, then cut into MVT tiles
+per zoom level. Every tile is clipped to its (slightly buffered) extent and
+simplified to that zoom's pixel size, then cached on disk; the low zoom
+levels are pre-tiled when a tile set is first loaded and deeper tiles are cut
+on first request. A small HTTP server in a background thread serves the
+tiles, so the browser only fetches tiles it can see and no external tile
+service is involved. Browsers on other machines reach the server through
+GEODATA_TILE_URL; without it, their maps fall back to inline GeoJSON. For fully offline use the same server also serves
+vendored copies of the map scripts and stylesheets (fetched once with
+`python vector_tiles.py --fetch-assets`), and maps are drawn without a
+basemap.
+
+Tiles carry geometry and the region key only; colors and values are applied
+in the browser from a per-map lookup, so one tile set serves every data
+column and color scheme drawn on the same boundaries. A tile set's id ends
+in a digest of its geometry, keys and the tile format, so tiles cached on
+disk are never served for boundaries or an encoding they were not cut from.
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import numpy as np
+import shapely
+from folium.plugins import VectorGridProtobuf
+from jinja2 import Template
+
+try:
+    import mapbox_vector_tile
+except ImportError:  # pragma: no cover - optional dependency
+    mapbox_vector_tile = None
+
+TILE_DIR = os.environ.get("GEODATA_TILE_DIR", os.path.join(tempfile.gettempdir(), "geodata-tiles"))
+TILE_HOST = os.environ.get("GEODATA_TILE_HOST", "127.0.0.1")
+# Port 0 lets the system pick a free port, so several app processes can share a host
+TILE_PORT = int(os.environ.get("GEODATA_TILE_PORT", "0"))
+# URL the browser uses to reach the tile server, when it differs from host:port; set a fixed
+# GEODATA_TILE_PORT with it, since a proxy cannot follow a port picked at startup. Without it
+# only browsers on the app's own host can load tiles
+TILE_PUBLIC_URL = os.environ.get("GEODATA_TILE_URL")
+
+# Host names under which a browser is on the same machine as the app
+LOOPBACK_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+# Scripts and stylesheets vendored for offline use; GEODATA_OFFLINE=1 makes maps load them from here
+ASSET_DIR = os.environ.get("GEODATA_TILE_ASSETS",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+OFFLINE = os.environ.get("GEODATA_OFFLINE", "0") == "1"
+
+# Zoom levels cut ahead of the first request; deeper tiles are cut and cached on demand
+PRETILE_MAX_ZOOM = int(os.environ.get("GEODATA_PRETILE_ZOOM", "5"))
+
+# Bump when encode_tile changes what it writes, so tiles cached on disk are cut again
+TILE_FORMAT_VERSION = 1
+
+TILE_LAYER = "regions"
+TILE_EXTENT = 4096
+TILE_BUFFER = 64 / TILE_EXTENT
+MAX_TILE_ZOOM = 10
+
+# Web Mercator constants
+EARTH_HALF_CIRCUMFERENCE = 20037508.342789244
+MAX_LATITUDE = 85.0511287798
+
+_TILE_PATH = re.compile(r"^/([A-Za-z0-9_.-]+)/(\d+)/(\d+)/(\d+)\.pbf$")
+_ASSET_PATH = re.compile(r"^/assets/([A-Za-z0-9_-][A-Za-z0-9_.-]*\.(js|css))$")
+ASSET_TYPES = {"js": "application/javascript", "css": "text/css"}
+
+
+# Function to project lon/lat geometry to Web Mercator metres
+def to_web_mercator(geometry):
+    def project(coords):
+        lon = coords[:, 0]
+        lat = np.clip(coords[:, 1], -MAX_LATITUDE, MAX_LATITUDE)
+        x = lon * EARTH_HALF_CIRCUMFERENCE / 180.0
+        y = np.log(np.tan((90.0 + lat) * np.pi / 360.0)) * EARTH_HALF_CIRCUMFERENCE / np.pi
+        return np.column_stack([x, y])
+    return shapely.transform(geometry, project)
+
+
+# Function to compute the Web Mercator bounds of a tile
+def tile_bounds(z, x, y):
+    size = 2 * EARTH_HALF_CIRCUMFERENCE / (2 ** z)
+    minx = -EARTH_HALF_CIRCUMFERENCE + x * size
+    maxy = EARTH_HALF_CIRCUMFERENCE - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+# Function to digest the geometry and keys a tile set is cut from, together with the tile format
+def tileset_digest(geometry, keys):
+    digest = hashlib.blake2b(f"tiles-v{TILE_FORMAT_VERSION}:{MAX_TILE_ZOOM}:{TILE_EXTENT}".encode(), digest_size=8)
+    for key, wkb in zip(keys, shapely.to_wkb(geometry)):
+        digest.update(key.encode())
+        digest.update(wkb)
+    return digest.hexdigest()
+
+
+class TileSet:
+    """Polygons projected once and cut into MVT tiles on demand, cached on disk."""
+
+    def __init__(self, tileset_id, geo_data, key_column, tile_dir=TILE_DIR, max_zoom=MAX_TILE_ZOOM):
+        if mapbox_vector_tile is None:
+            raise ImportError("Vector tiles need the mapbox-vector-tile package")
+        if geo_data.crs is not None and geo_data.crs.to_epsg() != 4326:
+            geo_data = geo_data.to_crs(epsg=4326)
+
+        self.max_zoom = max_zoom
+        self.keys = geo_data[key_column].astype(str).to_numpy()
+        # Tiles on disk outlive the process, so the id names exactly what they are cut from
+        self.tileset_id = f"{tileset_id}-{tileset_digest(geo_data.geometry.to_numpy(), self.keys)}"
+        self.directory = os.path.join(tile_dir, self.tileset_id)
+        self.geometry = to_web_mercator(geo_data.geometry.to_numpy())
+        self.tree = shapely.STRtree(self.geometry)
+
+    def tile_path(self, z, x, y):
+        return os.path.join(self.directory, str(z), str(x), f"{y}.pbf")
+
+    def encode_tile(self, z, x, y):
+        minx, miny, maxx, maxy = tile_bounds(z, x, y)
+        pad = (maxx - minx) * TILE_BUFFER
+        clip_box = (minx - pad, miny - pad, maxx + pad, maxy + pad)
+
+        candidates = self.tree.query(shapely.box(*clip_box))
+        if len(candidates) == 0:
+            return b""
+
+        # Simplify to half a tile pixel at this zoom before encoding
+        pixel = (maxx - minx) / TILE_EXTENT
+        clipped = shapely.clip_by_rect(self.geometry[candidates], *clip_box)
+        clipped = shapely.simplify(clipped, pixel / 2, preserve_topology=True)
+        features = [
+            {"geometry": geom, "properties": {"key": key}}
+            for geom, key in zip(clipped, self.keys[candidates])
+            if not geom.is_empty
+        ]
+        if not features:
+            return b""
+        return mapbox_vector_tile.encode(
+            [{"name": TILE_LAYER, "features": features}],
+            default_options={"quantize_bounds": (minx, miny, maxx, maxy), "extents": TILE_EXTENT},
+        )
+
+    def get_tile(self, z, x, y):
+        if z > self.max_zoom or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            return b""
+        path = self.tile_path(z, x, y)
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+
+        data = self.encode_tile(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return data
+
+    def pretile(self, max_zoom=None):
+        # Only tiles touched by some feature's bounding box are generated
+        max_zoom = self.max_zoom if max_zoom is None else max_zoom
+        bounds = shapely.bounds(self.geometry)
+        count = 0
+        for z in range(max_zoom + 1):
+            n = 2 ** z
+            size = 2 * EARTH_HALF_CIRCUMFERENCE / n
+            x0 = np.floor((bounds[:, 0] + EARTH_HALF_CIRCUMFERENCE) / size).clip(0, n - 1).astype(int)
+            x1 = np.floor((bounds[:, 2] + EARTH_HALF_CIRCUMFERENCE) / size).clip(0, n - 1).astype(int)
+            y0 = np.floor((EARTH_HALF_CIRCUMFERENCE - bounds[:, 3]) / size).clip(0, n - 1).astype(int)
+            y1 = np.floor((EARTH_HALF_CIRCUMFERENCE - bounds[:, 1]) / size).clip(0, n - 1).astype(int)
+            tiles = set()
+            for a, b, c, d in zip(x0, x1, y0, y1):
+                tiles.update((x, y) for x in range(a, b + 1) for y in range(c, d + 1))
+            for x, y in tiles:
+                # Tiles cut by an earlier process from the same boundaries are reused as they are
+                if not os.path.exists(self.tile_path(z, x, y)):
+                    self.get_tile(z, x, y)
+            count += len(tiles)
+        return count
+
+
+# Function to name the vendored copy of a script or stylesheet
+def asset_name(name, kind):
+    return f"{name}.{kind}"
+
+
+# Function to walk a map's elements and the scripts and stylesheets each one loads
+def _map_assets(m):
+    elements = [m]
+    while elements:
+        element = elements.pop()
+        for kind in ASSET_TYPES:
+            links = getattr(element, f"default_{kind}", None)
+            if links:
+                yield element, kind, links
+        elements.extend(element._children.values())
+
+
+# Function to point a map's scripts and stylesheets at the vendored copies that exist
+def localize_assets(m, asset_url, asset_dir=ASSET_DIR):
+    for element, kind, links in _map_assets(m):
+        # Set on the element, so both folium's HTML and streamlit-folium pick the local URLs up
+        setattr(element, f"default_{kind}", [
+            (name, f"{asset_url}/{asset_name(name, kind)}")
+            if os.path.isfile(os.path.join(asset_dir, asset_name(name, kind))) else (name, url)
+            for name, url in links
+        ])
+    return m
+
+
+# Function to list the scripts and stylesheets a map needs that are not vendored yet
+def missing_assets(m, asset_dir=ASSET_DIR):
+    return sorted({asset_name(name, kind) for _, kind, links in _map_assets(m) for name, _ in links
+                   if not os.path.isfile(os.path.join(asset_dir, asset_name(name, kind)))})
+
+
+class ChoroplethTileLayer(VectorGridProtobuf):
+    """Vector tile layer colored in the browser from a region key lookup."""
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) -%}
+            var {{ this.get_name() }} = (function(){
+                var lookup = {{ this.lookup|tojson }};
+                var layer = L.vectorGrid.protobuf({{ this.url|tojson }}, {
+                    interactive: true,
+                    maxNativeZoom: {{ this.max_native_zoom }},
+                    getFeatureId: function (feature) { return feature.properties.key; },
+                    vectorTileLayerStyles: {
+                        {{ this.tile_layer|tojson }}: function (properties) {
+                            var entry = lookup[properties.key];
+                            return {
+                                fill: true,
+                                fillColor: entry ? entry[0] : {{ this.missing_color|tojson }},
+                                fillOpacity: {{ this.fill_opacity }},
+                                color: "black",
+                                weight: 1,
+                                opacity: 0.2
+                            };
+                        }
+                    }
+                });
+                layer.on('click', function (e) {
+                    var key = e.layer.properties.key;
+                    var entry = lookup[key];
+                    L.popup()
+                        .setLatLng(e.latlng)
+                        .setContent(key + ': ' + (entry ? entry[1] : 'no data'))
+                        .openOn({{ this._parent.get_name() }});
+                });
+                layer.addTo({{ this._parent.get_name() }});
+                return layer;
+            })();
+        {%- endmacro %}
+        """
+    )
+
+    def __init__(self, url, keys, fills, values, name=None, missing_color="black",
+                 fill_opacity=0.7, max_native_zoom=MAX_TILE_ZOOM, **kwargs):
+        super().__init__(url, name=name, **kwargs)
+        self._name = "ChoroplethTileLayer"
+        self.lookup = {
+            str(key): [fill, None if value != value else float(value)]
+            for key, fill, value in zip(keys, fills, values)
+        }
+        self.tile_layer = TILE_LAYER
+        self.missing_color = missing_color
+        self.fill_opacity = fill_opacity
+        self.max_native_zoom = max_native_zoom
+
+
+class _TileRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        asset = _ASSET_PATH.match(path)
+        if asset is not None:
+            self._send_asset(*asset.groups())
+            return
+        match = _TILE_PATH.match(path)
+        tileset = self.server.tilesets.get(match.group(1)) if match else None
+        if tileset is None:
+            self.send_error(404)
+            return
+        z, x, y = (int(v) for v in match.groups()[1:])
+        data = tileset.get_tile(z, x, y)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-protobuf")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Cache-Control", "public, max-age=86400")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_asset(self, name, kind):
+        try:
+            with open(os.path.join(self.server.asset_dir, name), "rb") as f:
+                data = f.read()
+        except OSError:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ASSET_TYPES[kind])
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Cache-Control", "public, max-age=86400")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to tell whether a browser that reached the app under this Host header can load the tiles
+def tiles_reachable(browser_host, public_url=TILE_PUBLIC_URL):
+    if public_url:
+        return True
+    # Without a public URL, tile URLs name the server's own address, which a remote browser cannot reach;
+    # no Host header means there is no browser (bare mode or tests)
+    if not browser_host:
+        return True
+    return urlsplit(f"//{browser_host}").hostname in LOOPBACK_HOSTS
+
+
+class TileServer:
+    """Background HTTP server for every registered TileSet."""
+
+    def __init__(self, host=TILE_HOST, port=TILE_PORT, public_url=TILE_PUBLIC_URL, asset_dir=ASSET_DIR):
+        self.httpd = ThreadingHTTPServer((host, port), _TileRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.tilesets = {}
+        self.httpd.asset_dir = asset_dir
+        self.public_url = (public_url or f"http://{host}:{self.httpd.server_address[1]}").rstrip("/")
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="tile-server", daemon=True)
+        self.thread.start()
+
+    def register(self, tileset):
+        self.httpd.tilesets[tileset.tileset_id] = tileset
+        return self.tile_url(tileset.tileset_id)
+
+    def tile_url(self, tileset_id):
+        return f"{self.public_url}/{tileset_id}/{{z}}/{{x}}/{{y}}.pbf"
+
+    @property
+    def asset_url(self):
+        return f"{self.public_url}/assets"
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# Function to download the scripts and stylesheets a vector tile map loads, for offline use
+def fetch_assets(asset_dir=ASSET_DIR):
+    import urllib.request
+
+    import geopandas as gpd
+    import pandas as pd
+
+    from map_builders import create_vector_tile_map
+
+    # A one-region map pulls in the same elements as any vector tile map
+    region = gpd.GeoDataFrame({"key": ["a"]}, geometry=[shapely.box(0, 0, 1, 1)], crs="EPSG:4326")
+    tileset = TileSet("assets", region, "key", tile_dir=tempfile.mkdtemp())
+    m = create_vector_tile_map(pd.DataFrame({"key": ["a"], "value": [1.0]}), tileset, "", "key", "value")
+
+    os.makedirs(asset_dir, exist_ok=True)
+    fetched = []
+    for _, kind, links in _map_assets(m):
+        for name, url in links:
+            path = os.path.join(asset_dir, asset_name(name, kind))
+            if os.path.isfile(path):
+                continue
+            with urllib.request.urlopen(url) as response, open(f"{path}.tmp", "wb") as f:
+                f.write(response.read())
+            os.replace(f"{path}.tmp", path)
+            fetched.append(path)
+    return fetched
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local vector tile serving")
+    parser.add_argument("--fetch-assets", action="store_true",
+                        help=f"download the map scripts and stylesheets into {ASSET_DIR} for offline use")
+    args = parser.parse_args(argv)
+    if not args.fetch_assets:
+        parser.print_help()
+        return 0
+    for path in fetch_assets():
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Viewport-aware selection of what a map sends to the browser.
+
+st_folium reports the bounds and zoom of the map on screen. The bounds are
+widened by a margin and snapped outwards to a grid that follows the zoom, so
+small pans select exactly the same features again. Points are looked up in a
+latitude-sorted index and regions in the boundary pack's grid index (or an
+STRtree for boundaries that have no pack). When more than
+the feature cap are in view, points are binned into cells a few pixels wide
+at the current zoom and regions are cut down to the largest ones, so every
+rerun sends a bounded number of features and detail is refined as the user
+zooms in.
+"""
+import os
+from collections import namedtuple
+
+import numpy as np
+import shapely
+
+from geometry_lod import TILE_SIZE
+
+# Fraction of the view's width and height added on every side
+VIEWPORT_MARGIN = 0.25
+
+# Most points, cells or regions sent to the browser in one rerun
+VIEWPORT_MAX_FEATURES = int(os.environ.get("GEODATA_VIEWPORT_MAX_FEATURES", "5000"))
+
+# Points binned at the current zoom fall into cells about this many pixels wide
+VIEWPORT_CELL_PX = 16
+
+WORLD_BOUNDS = (-180.0, -90.0, 180.0, 90.0)
+
+# Bounds as (west, south, east, north) in degrees, and the Leaflet zoom level
+Viewport = namedtuple("Viewport", ["bounds", "zoom"])
+
+
+# Function to read the viewport from st_folium's return value, defaulting to the whole world
+def viewport_from_state(state, default_zoom):
+    try:
+        south_west, north_east = state["bounds"]["_southWest"], state["bounds"]["_northEast"]
+        bounds = (float(south_west["lng"]), float(south_west["lat"]),
+                  float(north_east["lng"]), float(north_east["lat"]))
+        zoom = int(state["zoom"])
+    except (KeyError, TypeError, ValueError):
+        # Before the browser has reported anything, the bounds are empty
+        return Viewport(WORLD_BOUNDS, default_zoom)
+    if not np.all(np.isfinite(bounds)) or bounds[0] >= bounds[2] or bounds[1] >= bounds[3]:
+        return Viewport(WORLD_BOUNDS, default_zoom)
+    return Viewport(bounds, zoom)
+
+
+# Function to return the width of one screen pixel in degrees at a zoom level
+def degrees_per_pixel(zoom):
+    return 360.0 / (TILE_SIZE * 2 ** zoom)
+
+
+# Function to widen the viewport by the margin and snap it outwards to a quarter-tile grid
+def query_bounds(viewport, margin=VIEWPORT_MARGIN):
+    west, south, east, north = viewport.bounds
+    dx, dy = (east - west) * margin, (north - south) * margin
+    step = degrees_per_pixel(viewport.zoom) * TILE_SIZE / 4
+    west, south = np.floor((west - dx) / step) * step, np.floor((south - dy) / step) * step
+    east, north = np.ceil((east + dx) / step) * step, np.ceil((north + dy) / step) * step
+    # A view wider than the world (wrapped longitudes) selects every longitude
+    if east - west >= 360.0:
+        west, east = -180.0, 180.0
+    return (float(max(west, -180.0)), float(max(south, -90.0)), float(min(east, 180.0)), float(min(north, 90.0)))
+
+
+class PointIndex:
+    """Point positions sorted by latitude for bounding-box queries."""
+
+    def __init__(self, lat, lon):
+        lat = np.asarray(lat, dtype='float64')
+        lon = np.asarray(lon, dtype='float64')
+        located = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        self.order = located[np.argsort(lat[located], kind='stable')]
+        self.lat = lat[self.order]
+        self.lon = lon[self.order]
+
+    def __len__(self):
+        return len(self.order)
+
+    def query(self, bounds):
+        west, south, east, north = bounds
+        # Binary search for the latitude band, then one vectorized longitude test within it
+        start, stop = np.searchsorted(self.lat, south, side='left'), np.searchsorted(self.lat, north, side='right')
+        lon = self.lon[start:stop]
+        return np.sort(self.order[start:stop][(lon >= west) & (lon <= east)])
+
+
+# Function to pick the points in view: every one under the cap, otherwise a cell size to bin them at
+def select_points(index, viewport, max_features=VIEWPORT_MAX_FEATURES, margin=VIEWPORT_MARGIN):
+    bounds = query_bounds(viewport, margin)
+    rows = index.query(bounds)
+    if len(rows) <= max_features:
+        return bounds, rows, None
+
+    west, south, east, north = bounds
+    cell_size = degrees_per_pixel(viewport.zoom) * VIEWPORT_CELL_PX
+    while (east - west) * (north - south) / cell_size ** 2 > max_features:
+        cell_size *= 2
+    return bounds, rows, cell_size
+
+
+# Function to keep the rows of the largest regions when there are more than the cap
+def _largest_regions(rows, areas, max_features):
+    if len(rows) > max_features:
+        rows = rows[np.argsort(-areas, kind='stable')[:max_features]]
+    return np.sort(rows)
+
+
+# Function to pick the regions in view, keeping the largest ones when there are too many
+def select_regions(tree, viewport, max_features=VIEWPORT_MAX_FEATURES, margin=VIEWPORT_MARGIN):
+    bounds = query_bounds(viewport, margin)
+    rows = tree.query(shapely.box(*bounds))
+    areas = shapely.area(tree.geometries.take(rows)) if len(rows) > max_features else None
+    return bounds, _largest_regions(rows, areas, max_features)
+
+
+# Function to pick the regions of a boundary pack in view from its grid index, without decoding geometry
+def select_pack_regions(pack, viewport, max_features=VIEWPORT_MAX_FEATURES, margin=VIEWPORT_MARGIN):
+    bounds = query_bounds(viewport, margin)
+    rows = pack.query_bbox(*bounds)
+    # Regions are ranked by bounding-box area, which the pack stores
+    box = pack.bounds[rows]
+    areas = (box[:, 2] - box[:, 0]) * (box[:, 3] - box[:, 1])
+    return bounds, _largest_regions(rows, areas, max_features)